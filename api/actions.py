@@ -1,21 +1,35 @@
 from __future__ import annotations
 
+import datetime
+from typing import AsyncIterator
 from typing import Optional
 from typing import Sequence
 from uuid import UUID
 
+from sqlalchemy import Row
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from api.cache import report_cache
+from api.schemas import BreakdownRequest
+from api.schemas import BreakdownResponse
+from api.schemas import BulkUpdatedProductResponse
+from api.schemas import BulkUpdateProductRequest
 from api.schemas import CreateProduct
 from api.schemas import CreateShipment
+from api.schemas import decode_shipment_cursor
 from api.schemas import DeletedProductsResponse
+from api.schemas import encode_shipment_cursor
 from api.schemas import ReportRequest
 from api.schemas import ReportResponse
+from api.schemas import ShipmentPage
 from api.schemas import ShowProduct
 from api.schemas import ShowShipment
+from api.schemas import ShowShipmentWithProducts
 from database.dal import ShipmentsDAL
 from database.model import Products
 from database.model import Shipments
+from database.session import enable_transaction
+from settings import EXPORT_CHUNK_SIZE
 
 
 class ShipmentRepository:
@@ -27,6 +41,7 @@ class ShipmentRepository:
             shipment_dal = ShipmentsDAL(session)
             shipment = await shipment_dal.create_shipment(
                 shipment_num=body.shipment_num,
+                shipment_merchant=body.shipment_merchant,
                 shipment_status=body.shipment_status,
                 shipment_date=body.shipment_date,
                 shipping_address=body.shipping_address,
@@ -40,6 +55,7 @@ class ShipmentRepository:
                 create_date=shipment.create_date,
                 last_updated=shipment.last_updated,
                 shipment_num=shipment.shipment_num,
+                shipment_merchant=shipment.shipment_merchant,
                 shipment_status=shipment.shipment_status,
                 shipment_date=shipment.shipment_date,
                 shipping_address=shipment.shipping_address,
@@ -62,25 +78,78 @@ class ShipmentRepository:
                 return shipment
             return
 
+    @classmethod
+    async def _get_shipments_page(
+        cls,
+        session: AsyncSession,
+        limit: int,
+        cursor: Optional[str] = None,
+        shipment_status: Optional[str] = None,
+        date_from: Optional[datetime.date] = None,
+        date_to: Optional[datetime.date] = None,
+    ) -> ShipmentPage:
+        after = decode_shipment_cursor(cursor) if cursor else None
+        async with session.begin():
+            shipment_dal = ShipmentsDAL(session)
+            shipments = await shipment_dal.get_shipments_page(
+                limit=limit + 1,
+                after=after,
+                shipment_status=shipment_status,
+                date_from=date_from,
+                date_to=date_to
+            )
+            next_cursor = None
+            if len(shipments) > limit:
+                shipments = shipments[:limit]
+                next_cursor = encode_shipment_cursor(shipments[-1].shipment_date, shipments[-1].id)
+            return ShipmentPage(
+                items=[ShowShipment.model_validate(shipment) for shipment in shipments],
+                next_cursor=next_cursor
+            )
+
+    @classmethod
+    async def _stream_shipments_with_products(
+        cls,
+        session: AsyncSession,
+        shipment_nums: Optional[Sequence[str]] = None,
+        date_from: Optional[datetime.date] = None,
+        date_to: Optional[datetime.date] = None,
+    ) -> AsyncIterator[ShowShipmentWithProducts]:
+        async with session.begin():
+            await enable_transaction(session, isolation_level='REPEATABLE READ')
+            shipment_dal = ShipmentsDAL(session)
+            async for shipments in shipment_dal.stream_shipments_with_products(
+                shipment_nums=shipment_nums, date_from=date_from, date_to=date_to
+            ):
+                for shipment in shipments:
+                    yield ShowShipmentWithProducts.model_validate(shipment)
+
+    @classmethod
+    async def _get_final_shipment_nums(cls, session: AsyncSession) -> set[str]:
+        async with session.begin():
+            shipment_dal = ShipmentsDAL(session)
+            return await shipment_dal.get_final_shipment_nums()
+
     @classmethod
     async def _update_shipment(
         cls, updated_shipment_params: dict, shipment_num: str, session: AsyncSession
-    ) -> Optional[UUID]:
+    ) -> Optional[Row]:
         async with session.begin():
             shipment_dal = ShipmentsDAL(session)
-            updated_shipment_num = await shipment_dal.update_shipment_by_num(
+            updated_shipment = await shipment_dal.update_shipment_by_num(
                 shipment_num=shipment_num, **updated_shipment_params
             )
-            return updated_shipment_num
+            return updated_shipment
 
     @classmethod
     async def _delete_shipment_by_num(
-        cls, shipment_num: str, session: AsyncSession
-    ) -> Optional[Products]:
+        cls, shipment_num: str, session: AsyncSession, cascade: bool = False
+    ) -> Optional[Row]:
         async with session.begin():
+            await enable_transaction(session)
             shipments_dal = ShipmentsDAL(session)
             deleted_shipment = await shipments_dal.delete_shipment_by_num(
-                shipment_num=shipment_num
+                shipment_num=shipment_num, cascade=cascade
             )
             return deleted_shipment
 
@@ -90,24 +159,66 @@ class ProductRepository:
     async def _create_new_product(
         cls, body: CreateProduct, session: AsyncSession
     ) -> ShowProduct:
-        shipment_dal = ShipmentsDAL(session)
-        product = await shipment_dal.create_product(
-            product_name=body.product_name,
-            quantity=body.quantity,
-            purchase_price=body.purchase_price,
-            purchase_status=body.purchase_status,
-            shipment_num=body.shipment_num
-        )
-        return ShowProduct(
-            id=product.id,
-            create_date=product.create_date,
-            last_updated=product.last_updated,
-            product_name=product.product_name,
-            quantity=product.quantity,
-            purchase_price=product.purchase_price,
-            purchase_status=product.purchase_status,
-            shipment_num=product.shipment_num
-        )
+        async with session.begin():
+            shipment_dal = ShipmentsDAL(session)
+            product = await shipment_dal.create_product(
+                product_name=body.product_name,
+                quantity=body.quantity,
+                quantity_unit=body.quantity_unit,
+                purchase_price=body.purchase_price,
+                purchase_status=body.purchase_status,
+                shipment_num=body.shipment_num
+            )
+            return ShowProduct(
+                id=product.id,
+                create_date=product.create_date,
+                last_updated=product.last_updated,
+                product_name=product.product_name,
+                quantity=product.quantity,
+                quantity_unit=product.quantity_unit,
+                purchase_price=product.purchase_price,
+                purchase_status=product.purchase_status,
+                shipment_num=product.shipment_num
+            )
+
+    @classmethod
+    async def _create_new_products(
+        cls, body: Sequence[CreateProduct], session: AsyncSession
+    ) -> list[ShowProduct]:
+        async with session.begin():
+            await enable_transaction(session)
+            shipment_dal = ShipmentsDAL(session)
+            products = await shipment_dal.create_products_returning(
+                [product.model_dump() for product in body]
+            )
+            return [ShowProduct.model_validate(product) for product in products]
+
+    @classmethod
+    async def _update_products(
+        cls, body: Sequence[BulkUpdateProductRequest], session: AsyncSession
+    ) -> list[BulkUpdatedProductResponse]:
+        updated_params = [item.model_dump(exclude_none=True) for item in body]
+        async with session.begin():
+            await enable_transaction(session)
+            shipment_dal = ShipmentsDAL(session)
+            existing_ids = await shipment_dal.get_existing_product_ids(
+                [params['id'] for params in updated_params]
+            )
+            await shipment_dal.update_products_bulk(
+                [params for params in updated_params if params['id'] in existing_ids and len(params) > 1]
+            )
+        results = []
+        for params in updated_params:
+            if params['id'] not in existing_ids:
+                detail = 'Продукт отсутствует.'
+            elif len(params) == 1:
+                detail = 'Укажите хотя бы один параметр для обновления'
+            else:
+                detail = None
+            results.append(
+                BulkUpdatedProductResponse(id=params['id'], updated=detail is None, detail=detail)
+            )
+        return results
 
     @classmethod
     async def _get_products_by_shipment_num(
@@ -143,7 +254,7 @@ class ProductRepository:
             deleted_products = await shipments_dal.delete_products_by_shipment_num(
                 shipment_num=shipment_num
             )
-            if deleted_products is not None:
+            if deleted_products:
                 deleted_products = [{'deleted_products_id': id_} for id_ in deleted_products]
                 return deleted_products
             return
@@ -154,10 +265,105 @@ class ReportRepository:
     async def _get_spending_report(
         cls, body: ReportRequest, session: AsyncSession
     ) -> ReportResponse:
+        report = report_cache.get(body.date_from, body.date_to)
+        if report is not None:
+            return report
         async with session.begin():
             shipments_dal = ShipmentsDAL(session)
             report = await shipments_dal.get_spending_report(
                 date_from=body.date_from,
                 date_to=body.date_to
             )
+            report_cache.set(body.date_from, body.date_to, report)
             return report
+
+    @classmethod
+    async def _get_spending_breakdown(
+        cls, body: BreakdownRequest, session: AsyncSession
+    ) -> BreakdownResponse:
+        async with session.begin():
+            shipments_dal = ShipmentsDAL(session)
+            breakdown = await shipments_dal.get_spending_breakdown(
+                date_from=body.date_from,
+                date_to=body.date_to,
+                group_by=body.group_by.value,
+                limit=body.limit,
+                offset=body.offset,
+                top_products=body.top_products
+            )
+            return BreakdownResponse(
+                group_by=body.group_by,
+                date_from=body.date_from,
+                date_to=body.date_to,
+                limit=body.limit,
+                offset=body.offset,
+                **breakdown
+            )
+
+
+class ExportRepository:
+    @classmethod
+    async def _stream_table_rows(
+        cls,
+        session: AsyncSession,
+        model: type[Shipments] | type[Products],
+        date_from: Optional[datetime.date] = None,
+        date_to: Optional[datetime.date] = None,
+    ) -> AsyncIterator[Sequence[Row]]:
+        async with session.begin():
+            await enable_transaction(session, isolation_level='REPEATABLE READ')
+            shipments_dal = ShipmentsDAL(session)
+            async for rows in shipments_dal.stream_table_rows(
+                model=model, date_from=date_from, date_to=date_to, yield_per=EXPORT_CHUNK_SIZE
+            ):
+                yield rows
+
+
+class ImportRepository:
+    @classmethod
+    async def _bulk_create(
+        cls,
+        shipments: Sequence[CreateShipment],
+        products: Sequence[CreateProduct],
+        session: AsyncSession
+    ) -> None:
+        async with session.begin():
+            await enable_transaction(session)
+            shipments_dal = ShipmentsDAL(session)
+            await shipments_dal.create_shipments_bulk(
+                [shipment.model_dump() for shipment in shipments]
+            )
+            await shipments_dal.create_products_bulk(
+                [product.model_dump() for product in products]
+            )
+
+    @classmethod
+    async def _bulk_upsert(
+        cls,
+        shipments: Sequence[CreateShipment],
+        products: Sequence[CreateProduct],
+        session: AsyncSession
+    ) -> Sequence[str]:
+        async with session.begin():
+            await enable_transaction(session)
+            shipments_dal = ShipmentsDAL(session)
+            shipment_rows = [shipment.model_dump() for shipment in shipments]
+            product_rows = [product.model_dump() for product in products]
+            changed_shipment_nums = await shipments_dal.upsert_shipments(shipment_rows)
+            # a re-scrape may change only prices, quantities or statuses of the products
+            unchanged_shipment_nums = {row['shipment_num'] for row in shipment_rows} - set(changed_shipment_nums)
+            changed_shipment_nums = [
+                *changed_shipment_nums,
+                *await shipments_dal.get_shipments_with_changed_products(
+                    list(unchanged_shipment_nums), product_rows
+                ),
+            ]
+            await shipments_dal.replace_products(changed_shipment_nums, product_rows)
+            return changed_shipment_nums
+
+    @classmethod
+    async def _refresh_spending_daily(cls, session: AsyncSession) -> None:
+        async with session.begin():
+            await enable_transaction(session)
+            shipments_dal = ShipmentsDAL(session)
+            await shipments_dal.refresh_spending_daily()
@@ -0,0 +1,140 @@
+from __future__ import annotations
+
+import datetime
+import time
+from abc import ABC
+from abc import abstractmethod
+from collections import OrderedDict
+from typing import Any
+from typing import Iterable
+from typing import Optional
+
+from settings import REPORT_CACHE_SIZE
+from settings import REPORT_CACHE_TTL
+
+
+class CacheBackend(ABC):
+    """Storage used by ReportCache, implement it to share the cache between processes"""
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[Any]:
+        ...
+
+    @abstractmethod
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        ...
+
+    @abstractmethod
+    def delete(self, key: str) -> None:
+        ...
+
+    @abstractmethod
+    def keys(self) -> Iterable[str]:
+        ...
+
+    @abstractmethod
+    def clear(self) -> None:
+        ...
+
+
+class MemoryCacheBackend(CacheBackend):
+    """In-process LRU cache with per-entry expiration"""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.entries: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+
+    def get(self, key: str) -> Optional[Any]:
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        self.entries[key] = (time.monotonic() + ttl, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        self.entries.pop(key, None)
+
+    def keys(self) -> Iterable[str]:
+        return list(self.entries)
+
+    def clear(self) -> None:
+        self.entries.clear()
+
+
+class ReportCache:
+    """Spending reports keyed by date range. A shipment write invalidates only
+    the cached ranges which contain its date."""
+
+    prefix = 'report'
+
+    def __init__(self, backend: CacheBackend, ttl: float):
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @classmethod
+    def make_key(cls, date_from: datetime.date, date_to: datetime.date) -> str:
+        return f'{cls.prefix}:{date_from.isoformat()}:{date_to.isoformat()}'
+
+    @classmethod
+    def parse_key(cls, key: str) -> Optional[tuple[datetime.date, datetime.date]]:
+        prefix, _, date_range = key.partition(':')
+        if prefix != cls.prefix:
+            return None
+        date_from, date_to = date_range.split(':')
+        return datetime.date.fromisoformat(date_from), datetime.date.fromisoformat(date_to)
+
+    def get(self, date_from: datetime.date, date_to: datetime.date) -> Optional[dict]:
+        if self.ttl <= 0:
+            return None
+        report = self.backend.get(self.make_key(date_from, date_to))
+        if report is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return report
+
+    def set(self, date_from: datetime.date, date_to: datetime.date, report: dict) -> None:
+        if self.ttl > 0:
+            self.backend.set(self.make_key(date_from, date_to), report, self.ttl)
+
+    def invalidate(self, *shipment_dates: Optional[datetime.date]) -> None:
+        shipment_dates = tuple(shipment_date for shipment_date in shipment_dates if shipment_date is not None)
+        if not shipment_dates:
+            return
+        for key in self.backend.keys():
+            date_range = self.parse_key(key)
+            if date_range is None:
+                continue
+            date_from, date_to = date_range
+            if any(date_from <= shipment_date <= date_to for shipment_date in shipment_dates):
+                self.backend.delete(key)
+                self.invalidations += 1
+
+    def clear(self) -> None:
+        self.backend.clear()
+
+    def stats(self) -> dict:
+        requests = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'invalidations': self.invalidations,
+            'hit_ratio': self.hits / requests if requests else 0.0,
+            'ttl': self.ttl,
+        }
+
+
+report_cache = ReportCache(MemoryCacheBackend(max_size=REPORT_CACHE_SIZE), ttl=REPORT_CACHE_TTL)
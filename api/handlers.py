@@ -1,34 +1,76 @@
 from __future__ import annotations
 
+import datetime
+from typing import Optional
 from uuid import UUID
 
 from fastapi import APIRouter
 from fastapi import Depends
 from fastapi import HTTPException
+from fastapi import Query
+from fastapi.responses import PlainTextResponse
+from fastapi.responses import StreamingResponse
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from api.actions import ExportRepository
 from api.actions import ProductRepository
 from api.actions import ReportRepository
 from api.actions import ShipmentRepository
+from api.cache import report_cache
+from api.metrics import request_metrics
+from api.schemas import BreakdownGroupBy
+from api.schemas import BreakdownRequest
+from api.schemas import BreakdownResponse
+from api.schemas import BulkUpdatedProductResponse
+from api.schemas import BulkUpdateProductRequest
 from api.schemas import CreateProduct
 from api.schemas import CreateShipment
 from api.schemas import DeletedProductsResponse
 from api.schemas import DeletedShipmentsResponse
+from api.schemas import ExportFormat
+from api.schemas import ExportTable
+from api.schemas import PoolMetricsResponse
+from api.schemas import ReportCacheMetricsResponse
 from api.schemas import ReportRequest
 from api.schemas import ReportResponse
+from api.schemas import ShipmentPage
 from api.schemas import ShowProduct
 from api.schemas import ShowShipment
+from api.schemas import ShowShipmentWithProducts
 from api.schemas import UpdatedProductResponse
 from api.schemas import UpdatedShipmentResponse
 from api.schemas import UpdateProductRequest
 from api.schemas import UpdateShipmentRequest
+from api.streaming import parquet_supported
+from api.streaming import stream_csv
+from api.streaming import stream_json_array
+from api.streaming import stream_ndjson
+from api.streaming import stream_parquet
+from database import session as db_session
+from database.metrics import pool_metrics
+from database.model import Products
+from database.model import Shipments
 from database.session import get_async_session
+from settings import SHIPMENT_PAGE_SIZE
+from settings import SHIPMENT_PAGE_SIZE_MAX
 
 
 shipment_router = APIRouter()
 product_router = APIRouter()
 report_router = APIRouter()
+metrics_router = APIRouter()
+export_router = APIRouter()
+
+EXPORT_SERIALIZERS = {
+    ExportFormat.csv: (stream_csv, 'text/csv; charset=utf-8'),
+    ExportFormat.ndjson: (stream_ndjson, 'application/x-ndjson'),
+    ExportFormat.parquet: (stream_parquet, 'application/vnd.apache.parquet'),
+}
+EXPORT_MODELS = {
+    ExportTable.shipments: Shipments,
+    ExportTable.products: Products,
+}
 
 
 @shipment_router.get('/', response_model=ShowShipment)
@@ -42,14 +84,56 @@ async def get_shipment(
     return shipment
 
 
+@shipment_router.get('/list', response_model=ShipmentPage)
+async def get_shipments_page(
+    cursor: Optional[str] = None,
+    limit: int = Query(SHIPMENT_PAGE_SIZE, ge=1, le=SHIPMENT_PAGE_SIZE_MAX),
+    shipment_status: Optional[str] = None,
+    date_from: Optional[datetime.date] = None,
+    date_to: Optional[datetime.date] = None,
+    db: AsyncSession = Depends(get_async_session)
+) -> ShipmentPage:
+    return await ShipmentRepository._get_shipments_page(
+        session=db,
+        limit=limit,
+        cursor=cursor,
+        shipment_status=shipment_status,
+        date_from=date_from,
+        date_to=date_to
+    )
+
+
+@shipment_router.get('/batch', response_model=list[ShowShipmentWithProducts])
+async def get_shipments_batch(
+    shipment_num: Optional[list[str]] = Query(None),
+    date_from: Optional[datetime.date] = None,
+    date_to: Optional[datetime.date] = None,
+    db: AsyncSession = Depends(get_async_session)
+) -> StreamingResponse:
+    if not shipment_num and date_from is None and date_to is None:
+        raise HTTPException(
+            status_code=422,
+            detail='Укажите номера доставок или период'
+        )
+    shipments = ShipmentRepository._stream_shipments_with_products(
+        session=db,
+        shipment_nums=shipment_num,
+        date_from=date_from,
+        date_to=date_to
+    )
+    return StreamingResponse(stream_json_array(shipments), media_type='application/json')
+
+
 @shipment_router.post('/', response_model=ShowShipment)
 async def create_shipment(
     body: CreateShipment, db: AsyncSession = Depends(get_async_session)
 ) -> ShowShipment:
     try:
-        return await ShipmentRepository._create_new_shipment(body=body, session=db)
+        shipment = await ShipmentRepository._create_new_shipment(body=body, session=db)
     except IntegrityError as err:
         raise HTTPException(status_code=503, detail=f'Ошибка базы данных: {err}')
+    report_cache.invalidate(shipment.shipment_date)
+    return shipment
 
 
 @shipment_router.patch('/', response_model=UpdatedShipmentResponse)
@@ -65,49 +149,45 @@ async def update_shipment_by_num(
             detail='Укажите хотя бы один параметр для обновления'
         )
 
-    shipment_for_update = await ShipmentRepository._get_shipment_by_num(
-        shipment_num=shipment_num,
-        session=db
-    )
-    if shipment_for_update is None:
-        raise HTTPException(
-            status_code=404, detail=f'Номер доставки {shipment_num} отсутствует.'
-        )
-
     try:
-        updated_shipment_num = await ShipmentRepository._update_shipment(
+        updated_shipment = await ShipmentRepository._update_shipment(
             updated_shipment_params=updated_params,
             shipment_num=shipment_num,
             session=db
         )
     except IntegrityError as err:
         raise HTTPException(status_code=503, detail=f'Ошибка базы данных: {err}')
-    return UpdatedShipmentResponse(updated_shipment_num=updated_shipment_num)
+    if updated_shipment is None:
+        raise HTTPException(
+            status_code=404, detail=f'Номер доставки {shipment_num} отсутствует.'
+        )
+    report_cache.invalidate(updated_shipment.old_shipment_date, updated_shipment.shipment_date)
+    return UpdatedShipmentResponse(updated_shipment_num=updated_shipment.shipment_num)
 
 
 @shipment_router.delete('/', response_model=DeletedShipmentsResponse)
 async def delete_shipment(
-    shipment_num: str, db: AsyncSession = Depends(get_async_session)
+    shipment_num: str,
+    cascade: bool = False,
+    db: AsyncSession = Depends(get_async_session)
 ) -> DeletedShipmentsResponse:
-    deleted_shipment_num = await ShipmentRepository._get_shipment_by_num(
-        shipment_num=shipment_num,
-        session=db
-    )
-    if deleted_shipment_num is None:
-        raise HTTPException(
-            status_code=404, detail=f'Номер доставки {shipment_num} отсутствует.'
-        )
     try:
-        deleted_shipment_num = await ShipmentRepository._delete_shipment_by_num(
+        deleted_shipment = await ShipmentRepository._delete_shipment_by_num(
             shipment_num=shipment_num,
-            session=db
+            session=db,
+            cascade=cascade
         )
     except IntegrityError as err:
         raise HTTPException(
             status_code=503,
             detail=f'Имеются внешние ссылки. Сначала удалите продукты. Ошибка: {err}'
         )
-    return DeletedShipmentsResponse(deleted_shipment_num=deleted_shipment_num)
+    if deleted_shipment is None:
+        raise HTTPException(
+            status_code=404, detail=f'Номер доставки {shipment_num} отсутствует.'
+        )
+    report_cache.invalidate(deleted_shipment.shipment_date)
+    return DeletedShipmentsResponse(deleted_shipment_num=deleted_shipment.shipment_num)
 
 
 @product_router.get('/', response_model=list[ShowProduct])
@@ -134,6 +214,19 @@ async def create_product(
         )
 
 
+@product_router.post('/bulk', response_model=list[ShowProduct])
+async def create_products(
+    body: list[CreateProduct], db: AsyncSession = Depends(get_async_session)
+) -> list[ShowProduct]:
+    try:
+        return await ProductRepository._create_new_products(body=body, session=db)
+    except IntegrityError as err:
+        raise HTTPException(
+            status_code=503,
+            detail=f'Сначала создайте информацию о доставке. Ошибка: {err}'
+        )
+
+
 @product_router.patch('/', response_model=UpdatedProductResponse)
 async def update_product_by_id(
     product_id: UUID,
@@ -160,30 +253,39 @@ async def update_product_by_id(
     return UpdatedProductResponse(updated_product_id=updated_product_id)
 
 
+@product_router.patch('/bulk', response_model=list[BulkUpdatedProductResponse])
+async def update_products(
+    body: list[BulkUpdateProductRequest], db: AsyncSession = Depends(get_async_session)
+) -> list[BulkUpdatedProductResponse]:
+    try:
+        return await ProductRepository._update_products(body=body, session=db)
+    except IntegrityError as err:
+        raise HTTPException(
+            status_code=503,
+            detail=f'Проверьте существует ли указанная Вами доставка. Ошибка базы данных: {err}'
+        )
+
+
 @product_router.delete('/', response_model=list[DeletedProductsResponse])
 async def delete_products(
     shipment_num: str, db: AsyncSession = Depends(get_async_session)
 ) -> list[DeletedProductsResponse]:
-    products_for_delete = await ProductRepository._get_products_by_shipment_num(
+    deleted_products = await ProductRepository._delete_products_by_shipment_num(
         shipment_num=shipment_num,
         session=db
     )
-    if products_for_delete is None:
+    if deleted_products is None:
         raise HTTPException(
             status_code=404,
             detail=f'По номеру доставки {shipment_num} отсутствуют продукты'
         )
-    deleted_products = await ProductRepository._delete_products_by_shipment_num(
-        shipment_num=shipment_num,
-        session=db
-    )
     return deleted_products
 
 
 @report_router.get('/', response_model=ReportResponse)
 async def get_spending_report(
-    date_from: str,
-    date_to: str,
+    date_from: datetime.date,
+    date_to: datetime.date,
     db: AsyncSession = Depends(get_async_session)
 ) -> ReportResponse:
     body = ReportRequest(date_from=date_from, date_to=date_to)
@@ -192,3 +294,65 @@ async def get_spending_report(
         session=db
     )
     return report
+
+
+@report_router.get('/breakdown', response_model=BreakdownResponse)
+async def get_spending_breakdown(
+    date_from: datetime.date,
+    date_to: datetime.date,
+    group_by: BreakdownGroupBy = BreakdownGroupBy.month,
+    top_products: int = Query(10, ge=0, le=100),
+    limit: int = Query(50, ge=1, le=500),
+    offset: int = Query(0, ge=0),
+    db: AsyncSession = Depends(get_async_session)
+) -> BreakdownResponse:
+    body = BreakdownRequest(
+        date_from=date_from,
+        date_to=date_to,
+        group_by=group_by,
+        top_products=top_products,
+        limit=limit,
+        offset=offset
+    )
+    return await ReportRepository._get_spending_breakdown(body=body, session=db)
+
+
+@metrics_router.get('', response_class=PlainTextResponse)
+async def get_prometheus_metrics() -> PlainTextResponse:
+    return PlainTextResponse(request_metrics.render(), media_type='text/plain; version=0.0.4')
+
+
+@metrics_router.get('/pool', response_model=PoolMetricsResponse)
+async def get_pool_metrics() -> PoolMetricsResponse:
+    pool = db_session.engine.pool if db_session.engine is not None else None
+    return PoolMetricsResponse(**pool_metrics.snapshot(pool))
+
+
+@metrics_router.get('/report-cache', response_model=ReportCacheMetricsResponse)
+async def get_report_cache_metrics() -> ReportCacheMetricsResponse:
+    return ReportCacheMetricsResponse(**report_cache.stats())
+
+
+@export_router.get('/')
+async def export_table(
+    export_format: ExportFormat = Query(ExportFormat.csv, alias='format'),
+    table: ExportTable = ExportTable.shipments,
+    date_from: Optional[datetime.date] = None,
+    date_to: Optional[datetime.date] = None,
+    db: AsyncSession = Depends(get_async_session)
+) -> StreamingResponse:
+    if export_format is ExportFormat.parquet and not parquet_supported():
+        raise HTTPException(
+            status_code=501,
+            detail='Выгрузка в parquet недоступна: установите пакет pyarrow'
+        )
+    serializer, media_type = EXPORT_SERIALIZERS[export_format]
+    model = EXPORT_MODELS[table]
+    rows = ExportRepository._stream_table_rows(
+        session=db, model=model, date_from=date_from, date_to=date_to
+    )
+    return StreamingResponse(
+        serializer(list(model.__table__.columns), rows),
+        media_type=media_type,
+        headers={'Content-Disposition': f'attachment; filename="{table.value}.{export_format.value}"'}
+    )
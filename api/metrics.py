@@ -0,0 +1,177 @@
+from __future__ import annotations
+
+import bisect
+import logging
+import time
+from typing import Iterable
+from typing import Optional
+
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp
+from starlette.types import Message
+from starlette.types import Receive
+from starlette.types import Scope
+from starlette.types import Send
+
+from api.cache import report_cache
+from database import session as db_session
+from database.metrics import pool_metrics
+from database.query_log import QueryStats
+from database.query_log import track_queries
+from settings import SERVER_TIMING
+
+
+logger = logging.getLogger('api.requests')
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+
+class Histogram:
+    """Cumulative Prometheus histogram of one label set"""
+
+    def __init__(self, buckets: Iterable[float]):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            self.counts[index] += 1
+        self.count += 1
+        self.sum += value
+
+    def samples(self, name: str, labels: str) -> Iterable[str]:
+        cumulative = 0
+        for bucket, count in zip(self.buckets, self.counts):
+            cumulative += count
+            yield f'{name}_bucket{{{labels},le="{bucket:g}"}} {cumulative}'
+        yield f'{name}_bucket{{{labels},le="+Inf"}} {self.count}'
+        yield f'{name}_sum{{{labels}}} {self.sum:.6f}'
+        yield f'{name}_count{{{labels}}} {self.count}'
+
+
+class RequestMetrics:
+    """Per route latency, database time, query count and pool wait histograms"""
+
+    histograms = {
+        'http_request_duration_seconds': ('Request latency', LATENCY_BUCKETS),
+        'http_request_db_seconds': ('Time spent executing SQL per request', LATENCY_BUCKETS),
+        'http_request_pool_wait_seconds': ('Time spent waiting for a pool connection per request', LATENCY_BUCKETS),
+        'http_request_queries': ('SQL statements per request', QUERY_COUNT_BUCKETS),
+    }
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self) -> None:
+        self.routes: dict[tuple[str, str], dict[str, Histogram]] = {}
+        self.responses: dict[tuple[str, str, int], int] = {}
+
+    def observe(self, method: str, route: str, status_code: int, seconds: float, stats: QueryStats) -> None:
+        histograms = self.routes.get((method, route))
+        if histograms is None:
+            histograms = self.routes[(method, route)] = {
+                name: Histogram(buckets) for name, (_, buckets) in self.histograms.items()
+            }
+        histograms['http_request_duration_seconds'].observe(seconds)
+        histograms['http_request_db_seconds'].observe(stats.seconds)
+        histograms['http_request_pool_wait_seconds'].observe(stats.pool_wait_seconds)
+        histograms['http_request_queries'].observe(stats.count)
+        key = (method, route, status_code)
+        self.responses[key] = self.responses.get(key, 0) + 1
+
+    def render(self) -> str:
+        """request, pool and report cache metrics in the Prometheus text format"""
+        lines = [
+            '# HELP http_requests_total Finished requests',
+            '# TYPE http_requests_total counter',
+        ]
+        for (method, route, status_code), count in sorted(self.responses.items()):
+            lines.append(f'http_requests_total{{method="{method}",route="{route}",status="{status_code}"}} {count}')
+        for name, (description, _) in self.histograms.items():
+            lines.append(f'# HELP {name} {description}')
+            lines.append(f'# TYPE {name} histogram')
+            for (method, route), histograms in sorted(self.routes.items()):
+                lines.extend(histograms[name].samples(name, f'method="{method}",route="{route}"'))
+
+        pool = pool_metrics.snapshot(db_session.engine.pool if db_session.engine is not None else None)
+        cache = report_cache.stats()
+        for name, metric_type, value in (
+            ('db_pool_checkouts_total', 'counter', pool['checkouts']),
+            ('db_pool_checkout_wait_seconds_total', 'counter', pool['checkout_wait_seconds']),
+            ('db_pool_checkout_held_seconds_total', 'counter', pool['checkout_held_seconds']),
+            ('db_pool_size', 'gauge', pool['pool_size']),
+            ('db_pool_checked_out', 'gauge', pool['checked_out']),
+            ('db_pool_overflow', 'gauge', pool['overflow']),
+            ('report_cache_hits_total', 'counter', cache['hits']),
+            ('report_cache_misses_total', 'counter', cache['misses']),
+            ('report_cache_invalidations_total', 'counter', cache['invalidations']),
+        ):
+            if value is not None:
+                lines.append(f'# TYPE {name} {metric_type}')
+                lines.append(f'{name} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+request_metrics = RequestMetrics()
+
+
+def route_path(scope: Scope) -> str:
+    """path template of the matched route, so that requests of one endpoint share a label"""
+    route = scope.get('route')
+    return getattr(route, 'path', 'unmatched')
+
+
+def server_timing(total: float, stats: QueryStats) -> str:
+    return (
+        f'db;dur={stats.seconds * 1000:.1f};desc="{stats.count} queries", '
+        f'pool;dur={stats.pool_wait_seconds * 1000:.1f}, '
+        f'app;dur={total * 1000:.1f}'
+    )
+
+
+class RequestMetricsMiddleware:
+    """Records request metrics and logs one line per request with its status,
+    duration and the number and time of database queries.
+
+    Metrics and the log line are written once the response body is sent, so
+    queries of streaming responses are counted too. With ``server_timing`` the
+    time spent until the response headers is sent in a Server-Timing header.
+    """
+
+    def __init__(self, app: ASGIApp, server_timing: bool = SERVER_TIMING):
+        self.app = app
+        self.server_timing = server_timing
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        stats = track_queries()
+        started = time.perf_counter()
+        status_code: Optional[int] = None
+
+        async def send_wrapper(message: Message):
+            nonlocal status_code
+            if message['type'] == 'http.response.start':
+                status_code = message['status']
+                if self.server_timing:
+                    headers = MutableHeaders(scope=message)
+                    headers.append('Server-Timing', server_timing(time.perf_counter() - started, stats))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            route = route_path(scope)
+            status_code = status_code or 500
+            request_metrics.observe(scope['method'], route, status_code, elapsed, stats)
+            logger.info(
+                'request method=%s path=%s status=%s duration_ms=%.1f queries=%d db_ms=%.1f pool_wait_ms=%.1f',
+                scope['method'], route, status_code, elapsed * 1000,
+                stats.count, stats.seconds * 1000, stats.pool_wait_seconds * 1000
+            )
@@ -1,16 +1,15 @@
 from __future__ import annotations
 
+import base64
+import binascii
 import datetime
-import re
+import decimal
 import uuid
+from enum import Enum
 from typing import Optional
 
 from fastapi import HTTPException
 from pydantic import BaseModel
-from pydantic import validator
-
-
-STRING_DATE_MATCH_PATTERN = re.compile(r'\d{4}-\d{2}-\d{2}')
 
 
 class TunedModel(BaseModel):
@@ -25,8 +24,9 @@ class ShowShipment(TunedModel):
     create_date: datetime.datetime
     last_updated: datetime.datetime
     shipment_num: str
+    shipment_merchant: Optional[str]
     shipment_status: Optional[str]
-    shipment_date: Optional[str]
+    shipment_date: Optional[datetime.date]
     shipping_address: Optional[str]
     shipping_cost: float
     bonuses: Optional[int]
@@ -34,10 +34,28 @@ class ShowShipment(TunedModel):
     discount: Optional[float]
 
 
+class ShipmentPage(BaseModel):
+    items: list[ShowShipment]
+    next_cursor: Optional[str]
+
+
+def encode_shipment_cursor(shipment_date: datetime.date, shipment_id: uuid.UUID) -> str:
+    return base64.urlsafe_b64encode(f'{shipment_date.isoformat()}|{shipment_id}'.encode()).decode()
+
+
+def decode_shipment_cursor(cursor: str) -> tuple[datetime.date, uuid.UUID]:
+    try:
+        shipment_date, shipment_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+        return datetime.date.fromisoformat(shipment_date), uuid.UUID(shipment_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise HTTPException(status_code=422, detail='Некорректный курсор.')
+
+
 class CreateShipment(BaseModel):
     shipment_num: str
+    shipment_merchant: Optional[str] = None
     shipment_status: Optional[str]
-    shipment_date: Optional[str]
+    shipment_date: Optional[datetime.date]
     shipping_address: Optional[str]
     shipping_cost: float
     bonuses: Optional[int]
@@ -46,8 +64,9 @@ class CreateShipment(BaseModel):
 
 
 class UpdateShipmentRequest(BaseModel):
+    shipment_merchant: Optional[str] = None
     shipment_status: Optional[str]
-    shipment_date: Optional[str]
+    shipment_date: Optional[datetime.date]
     shipping_address: Optional[str]
     shipping_cost: float
     bonuses: Optional[int]
@@ -68,15 +87,21 @@ class ShowProduct(TunedModel):
     create_date: datetime.datetime
     last_updated: datetime.datetime
     product_name: Optional[str]
-    quantity: Optional[str]
+    quantity: Optional[float]
+    quantity_unit: Optional[str] = None
     purchase_price: Optional[float]
     purchase_status: Optional[str]
     shipment_num: str
 
 
+class ShowShipmentWithProducts(ShowShipment):
+    products: list[ShowProduct]
+
+
 class CreateProduct(BaseModel):
     product_name: Optional[str]
-    quantity: Optional[str]
+    quantity: Optional[decimal.Decimal]
+    quantity_unit: Optional[str] = None
     purchase_price: Optional[float]
     purchase_status: Optional[str]
     shipment_num: str
@@ -84,12 +109,23 @@ class CreateProduct(BaseModel):
 
 class UpdateProductRequest(BaseModel):
     product_name: Optional[str]
-    quantity: Optional[str]
+    quantity: Optional[decimal.Decimal]
+    quantity_unit: Optional[str] = None
     purchase_price: Optional[float]
     purchase_status: Optional[str]
     shipment_num: Optional[str]
 
 
+class BulkUpdateProductRequest(UpdateProductRequest):
+    id: uuid.UUID
+
+
+class BulkUpdatedProductResponse(BaseModel):
+    id: uuid.UUID
+    updated: bool
+    detail: Optional[str]
+
+
 class UpdatedProductResponse(BaseModel):
     updated_product_id: uuid.UUID
 
@@ -99,25 +135,79 @@ class DeletedProductsResponse(BaseModel):
 
 
 class ReportRequest(BaseModel):
-    date_from: str
-    date_to: str
-
-    @validator('date_from')
-    def validate_date_from(cls, value):
-        if not STRING_DATE_MATCH_PATTERN.match(value):
-            raise HTTPException(
-                status_code=422, detail='Дата должна быть в формате yyyy-mm-dd.'
-            )
-        return value
-
-    @validator('date_to')
-    def validate_date_to(cls, value):
-        if not STRING_DATE_MATCH_PATTERN.match(value):
-            raise HTTPException(
-                status_code=422, detail='Дата должна быть в формате yyyy-mm-dd.'
-            )
-        return value
+    date_from: datetime.date
+    date_to: datetime.date
 
 
 class ReportResponse(TunedModel):
     report: str
+
+
+class BreakdownGroupBy(str, Enum):
+    month = 'month'
+    week = 'week'
+    address = 'address'
+    merchant = 'merchant'
+
+
+class BreakdownRequest(ReportRequest):
+    group_by: BreakdownGroupBy
+    top_products: int
+    limit: int
+    offset: int
+
+
+class SpendingGroup(BaseModel):
+    key: Optional[str]
+    shipments_count: int
+    spent: float
+    spent_with_bonuses: float
+
+
+class TopProduct(BaseModel):
+    product_name: Optional[str]
+    purchases: int
+    spent: float
+
+
+class BreakdownResponse(BaseModel):
+    group_by: BreakdownGroupBy
+    date_from: datetime.date
+    date_to: datetime.date
+    limit: int
+    offset: int
+    total_groups: int
+    groups: list[SpendingGroup]
+    top_products: list[TopProduct]
+
+
+class ExportFormat(str, Enum):
+    csv = 'csv'
+    parquet = 'parquet'
+    ndjson = 'ndjson'
+
+
+class ExportTable(str, Enum):
+    shipments = 'shipments'
+    products = 'products'
+
+
+class PoolMetricsResponse(BaseModel):
+    checkouts: int
+    checkout_wait_seconds: float
+    max_checkout_wait_seconds: float
+    avg_checkout_wait_seconds: float
+    checkins: int
+    checkout_held_seconds: float
+    max_checkout_held_seconds: float
+    pool_size: Optional[int]
+    checked_out: Optional[int]
+    overflow: Optional[int]
+
+
+class ReportCacheMetricsResponse(BaseModel):
+    hits: int
+    misses: int
+    invalidations: int
+    hit_ratio: float
+    ttl: float
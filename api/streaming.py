@@ -0,0 +1,135 @@
+from __future__ import annotations
+
+import csv
+import datetime
+import decimal
+import io
+import json
+import uuid
+from typing import Any
+from typing import AsyncIterator
+from typing import Sequence
+
+from pydantic import BaseModel
+from sqlalchemy import Column
+from sqlalchemy import Numeric
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # parquet export is optional
+    pyarrow = None
+
+Rows = AsyncIterator[Sequence[Sequence[Any]]]
+
+
+async def stream_json_array(items: AsyncIterator[BaseModel]) -> AsyncIterator[str]:
+    """serializes models one by one into a JSON array"""
+    separator = ''
+    yield '['
+    async for item in items:
+        yield separator + item.model_dump_json()
+        separator = ','
+    yield ']'
+
+
+async def stream_csv(columns: Sequence[Column], partitions: Rows) -> AsyncIterator[str]:
+    """serializes row chunks into CSV with a header line, one piece per chunk"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(column.key for column in columns)
+    async for rows in partitions:
+        writer.writerows(rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    if isinstance(value, (datetime.date, uuid.UUID)):
+        return str(value)
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+
+async def stream_ndjson(columns: Sequence[Column], partitions: Rows) -> AsyncIterator[str]:
+    """serializes row chunks into newline delimited JSON objects"""
+    keys = [column.key for column in columns]
+    async for rows in partitions:
+        yield ''.join(
+            json.dumps(dict(zip(keys, row)), default=_json_default, ensure_ascii=False) + '\n'
+            for row in rows
+        )
+
+
+def parquet_supported() -> bool:
+    return pyarrow is not None
+
+
+class ParquetSink:
+    """Write-only file object for ParquetWriter, the bytes written so far are
+    taken out with ``drain`` so the whole file is never held in memory"""
+
+    closed = False
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.position = 0
+
+    def write(self, data: bytes) -> int:
+        self.buffer += data
+        self.position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.position
+
+    def writable(self) -> bool:
+        return True
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data = bytes(self.buffer)
+        self.buffer.clear()
+        return data
+
+
+def _arrow_field(column: Column) -> 'pyarrow.Field':
+    if isinstance(column.type, Numeric) and column.type.asdecimal:
+        arrow_type = pyarrow.decimal128(column.type.precision, column.type.scale)
+    else:
+        arrow_type = {
+            str: pyarrow.string(),
+            int: pyarrow.int64(),
+            float: pyarrow.float64(),
+            uuid.UUID: pyarrow.string(),
+            datetime.date: pyarrow.date32(),
+            datetime.datetime: pyarrow.timestamp('us', tz='UTC'),
+        }[column.type.python_type]
+    return pyarrow.field(column.key, arrow_type, nullable=column.nullable)
+
+
+async def stream_parquet(columns: Sequence[Column], partitions: Rows) -> AsyncIterator[bytes]:
+    """writes every row chunk as a Parquet row group and yields the encoded bytes"""
+    schema = pyarrow.schema([_arrow_field(column) for column in columns])
+    as_text = [column.type.python_type is uuid.UUID for column in columns]
+    sink = ParquetSink()
+    with pyarrow.parquet.ParquetWriter(pyarrow.PythonFile(sink, mode='w'), schema) as writer:
+        async for rows in partitions:
+            arrays = [
+                pyarrow.array(
+                    [None if value is None else str(value) for value in values] if text else values,
+                    type=field.type
+                )
+                for values, text, field in zip(zip(*rows), as_text, schema)
+            ]
+            writer.write_table(pyarrow.Table.from_arrays(arrays, schema=schema))
+            yield sink.drain()
+    yield sink.drain()
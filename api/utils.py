@@ -1,56 +1,149 @@
 from __future__ import annotations
 
 import asyncio
+import datetime
+import decimal
 import json
+import re
+import time
+from typing import AsyncIterable
+from typing import AsyncIterator
+from typing import Iterable
+from typing import Optional
 
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from api.actions import ProductRepository
-from api.actions import ShipmentRepository
+from api.actions import ImportRepository
 from api.schemas import CreateProduct
 from api.schemas import CreateShipment
+from database.session import dispose_engine
 from database.session import get_async_session
+from progress import Progress
+from settings import IMPORT_BATCH_SIZE
 from settings import save_path_temp_files
 from settings import temp_json_shipments
 
 
-async def get_data_from_json(db_session: AsyncSession = get_async_session):
-
-    with open(f'{save_path_temp_files}/{temp_json_shipments}.json', 'r') as data:
-        shipments = json.load(data)
-
-        for shipment, shipment_data in shipments.items():
-            session = await anext(db_session())
-            await ShipmentRepository._create_new_shipment(
-                CreateShipment(
-                    shipment_num=shipment,
-                    shipment_status=shipment_data.get('shipment_status'),
-                    shipment_date=shipment_data.get('shipment_date'),
-                    shipping_address=shipment_data.get('shipping_address'),
-                    shipping_cost=shipment_data.get('shipping_cost'),
-                    bonuses=shipment_data.get('bonuses'),
-                    assembly_and_delivery=shipment_data.get('assembly_and_delivery'),
-                    discount=shipment_data.get('discount'),
-                ),
-                session
-            )
+QUANTITY_MATCH_PATTERN = re.compile(r'\s*(\d+(?:[.,]\d+)?)\s*(.*?)\s*$')
+
+
+def parse_shipment_date(shipment_date: Optional[str]) -> Optional[datetime.date]:
+    """parses parser dates like 2023-09-5, returns None for incomplete ones"""
+    try:
+        year, month, day = shipment_date.split('-')
+        return datetime.date(int(year), int(month), int(day))
+    except (AttributeError, ValueError):
+        return None
+
+
+def parse_quantity(quantity: Optional[str]) -> tuple[Optional[decimal.Decimal], Optional[str]]:
+    """splits quantities like '2 шт' or '0,5 кг' into amount and unit"""
+    if quantity is None:
+        return None, None
+    match = QUANTITY_MATCH_PATTERN.match(quantity)
+    if match is None:
+        return None, quantity.strip() or None
+    amount, unit = match.groups()
+    return decimal.Decimal(amount.replace(',', '.')), unit or None
+
+
+async def read_shipments(path: str) -> AsyncIterator[tuple[str, dict]]:
+    """yields shipments one by one from a newline-delimited JSON file"""
+    with open(path, 'r') as data:
+        for line in data:
+            if not line.strip():
+                continue
+            shipment_data = json.loads(line)
+            yield shipment_data.pop('shipment_num'), shipment_data
+
+
+async def batched(items: AsyncIterable, batch_size: int) -> AsyncIterator[list]:
+    batch = []
+    async for item in items:
+        batch.append(item)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
 
-            products = shipment_data.get('products')
-
-            for product, product_data in products.items():
-                await ProductRepository._create_new_product(
-                    CreateProduct(
-                        product_name=product_data.get('product_name'),
-                        quantity=product_data.get('quantity'),
-                        purchase_price=product_data.get('purchase_price'),
-                        purchase_status=product_data.get('purchase_status'),
-                        shipment_num=shipment
-                    ),
-                    session
+
+def build_import_batch(
+    shipments_batch: Iterable[tuple[str, dict]]
+) -> tuple[list[CreateShipment], list[CreateProduct]]:
+    shipments = []
+    products = []
+    for shipment, shipment_data in shipments_batch:
+        shipments.append(
+            CreateShipment(
+                shipment_num=shipment,
+                shipment_merchant=shipment_data.get('shipment_merchant'),
+                shipment_status=shipment_data.get('shipment_status'),
+                shipment_date=parse_shipment_date(shipment_data.get('shipment_date')),
+                shipping_address=shipment_data.get('shipping_address'),
+                shipping_cost=shipment_data.get('shipping_cost'),
+                bonuses=shipment_data.get('bonuses'),
+                assembly_and_delivery=shipment_data.get('assembly_and_delivery'),
+                discount=shipment_data.get('discount'),
+            )
+        )
+        for product, product_data in shipment_data.get('products', {}).items():
+            quantity, quantity_unit = parse_quantity(product_data.get('quantity'))
+            products.append(
+                CreateProduct(
+                    product_name=product_data.get('product_name'),
+                    quantity=quantity,
+                    quantity_unit=quantity_unit,
+                    purchase_price=product_data.get('purchase_price'),
+                    purchase_status=product_data.get('purchase_status'),
+                    shipment_num=shipment
                 )
+            )
+    return shipments, products
 
+
+async def get_data_from_json(
+    db_session: AsyncSession = get_async_session,
+    batch_size: int = IMPORT_BATCH_SIZE,
+    path: str = f'{save_path_temp_files}/{temp_json_shipments}.ndjson',
+    upsert: bool = False,
+    dry_run: bool = False,
+    progress: Optional[Progress] = None,
+):
+    """loads the NDJSON file in batches, with ``dry_run`` rows are only parsed and validated"""
+    session = await anext(db_session()) if not dry_run else None
+    started = time.perf_counter()
+    rows_total = 0
+    try:
+        async for shipments_batch in batched(read_shipments(path), batch_size):
+            batch_started = time.perf_counter()
+            shipment_rows, product_rows = build_import_batch(shipments_batch)
+            if dry_run:
+                action = 'Validated'
+            elif upsert:
+                changed = await ImportRepository._bulk_upsert(shipment_rows, product_rows, session)
+                print(f'{len(changed)} of {len(shipment_rows)} shipments are new or changed')
+                action = 'Loaded'
+            else:
+                await ImportRepository._bulk_create(shipment_rows, product_rows, session)
+                action = 'Loaded'
+
+            rows = len(shipment_rows) + len(product_rows)
+            rows_total += rows
+            batch_elapsed = time.perf_counter() - batch_started
+            print(
+                f'{action} {len(shipment_rows)} shipments and {len(product_rows)} products',
+                f'({rows / batch_elapsed:.0f} rows/s)'
+            )
+            if progress is not None:
+                progress.advance(len(shipment_rows))
+    finally:
+        if session is not None:
             await session.close()
 
+    elapsed = time.perf_counter() - started
+    print(f'Import finished: {rows_total} rows in {elapsed:.2f}s ({rows_total / elapsed:.0f} rows/s)')
+
 
 def main():
     loop = asyncio.new_event_loop()
@@ -58,6 +151,7 @@ def main():
         asyncio.set_event_loop(loop)
         return loop.run_until_complete(get_data_from_json())
     finally:
+        loop.run_until_complete(dispose_engine())
         loop.close()
 
 
@@ -0,0 +1,185 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import random
+import statistics
+import subprocess
+import time
+from typing import Callable
+from typing import Iterable
+
+import httpx
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from api.actions import ImportRepository
+from api.cache import report_cache
+from api.utils import batched
+from api.utils import build_import_batch
+from benchmarks.history import generate_history
+from database.session import dispose_engine
+from database.session import init_engine
+from database.session import SessionContextManager
+from main import app
+from settings import IMPORT_BATCH_SIZE
+from settings import TEST_DATABASE_URL
+from settings import TEST_DB_HOST
+from settings import TEST_DB_NAME
+from settings import TEST_DB_PASS
+from settings import TEST_DB_PORT
+from settings import TEST_DB_USER
+
+
+def migrate_test_database():
+    """alembic reads the connection from the DB_* settings, point them to the test database"""
+    env = dict(
+        os.environ,
+        DB_HOST=TEST_DB_HOST,
+        DB_PORT=TEST_DB_PORT,
+        DB_NAME=TEST_DB_NAME,
+        DB_USER=TEST_DB_USER,
+        DB_PASS=TEST_DB_PASS,
+    )
+    subprocess.run(['alembic', 'upgrade', 'head'], env=env, check=True)
+
+
+def percentile(latencies: list[float], fraction: float) -> float:
+    ordered = sorted(latencies)
+    return ordered[round(fraction * (len(ordered) - 1))]
+
+
+def summarize(latencies: list[float], elapsed: float, items: int) -> dict:
+    return {
+        'operations': len(latencies),
+        'items': items,
+        'elapsed_seconds': round(elapsed, 3),
+        'throughput_per_second': round(items / elapsed, 1) if elapsed else None,
+        'mean_ms': round(statistics.mean(latencies) * 1000, 3),
+        'p50_ms': round(percentile(latencies, 0.5) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+        'max_ms': round(max(latencies) * 1000, 3),
+    }
+
+
+async def seed(session: AsyncSession, history: Iterable[tuple[str, dict]], batch_size: int) -> dict:
+    """loads the history through the import path, every batch is one measured operation"""
+    async with session.begin():
+        await session.execute(text('TRUNCATE products, shipments, spending_daily'))
+
+    async def records():
+        for record in history:
+            yield record
+
+    latencies = []
+    rows = 0
+    started = time.perf_counter()
+    async for shipments_batch in batched(records(), batch_size):
+        batch_started = time.perf_counter()
+        shipment_rows, product_rows = build_import_batch(shipments_batch)
+        await ImportRepository._bulk_create(shipment_rows, product_rows, session)
+        latencies.append(time.perf_counter() - batch_started)
+        rows += len(shipment_rows) + len(product_rows)
+    return summarize(latencies, time.perf_counter() - started, rows)
+
+
+async def measure(
+    client: httpx.AsyncClient, path: str, make_params: Callable[[], dict], requests: int, concurrency: int
+) -> dict:
+    params = iter([make_params() for _ in range(requests)])
+    latencies = []
+
+    async def worker():
+        for request_params in params:
+            started = time.perf_counter()
+            response = await client.get(path, params=request_params)
+            response.raise_for_status()
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(latencies, time.perf_counter() - started, len(latencies))
+
+
+async def run(args: argparse.Namespace) -> dict:
+    init_engine(args.database_url)
+    rng = random.Random(args.seed)
+    today = datetime.date.today()
+    results = {}
+
+    def random_shipment() -> dict:
+        return {'shipment_num': f'B{rng.randrange(args.shipments):09d}'}
+
+    def random_period() -> dict:
+        date_to = today - datetime.timedelta(days=rng.randrange(args.years * 365))
+        date_from = date_to - datetime.timedelta(days=rng.choice([7, 30, 90, 365]))
+        return {'date_from': date_from.isoformat(), 'date_to': date_to.isoformat()}
+
+    ttl = report_cache.ttl
+    try:
+        if not args.skip_seed:
+            async with SessionContextManager() as session:
+                history = generate_history(args.shipments, args.products_per_shipment, args.years, args.seed)
+                results['bulk_load'] = await seed(session, history, args.batch_size)
+        if not args.report_cache:
+            report_cache.ttl = 0
+        async with httpx.AsyncClient(app=app, base_url='http://benchmark') as client:
+            for name, path, make_params in (
+                ('GET /shipment/', '/shipment/', random_shipment),
+                ('GET /product/', '/product/', random_shipment),
+                ('GET /report/', '/report/', random_period),
+            ):
+                results[name] = await measure(client, path, make_params, args.requests, args.concurrency)
+    finally:
+        report_cache.ttl = ttl
+        await dispose_engine()
+    return results
+
+
+def git_revision() -> str | None:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Seeds a synthetic history into the test database and measures the API and the bulk loader'
+    )
+    parser.add_argument('--database-url', default=TEST_DATABASE_URL)
+    parser.add_argument('--migrate', action='store_true', help='run alembic upgrade head on the test database')
+    parser.add_argument('--skip-seed', action='store_true', help='reuse the history seeded by a previous run')
+    parser.add_argument('--shipments', type=int, default=10_000)
+    parser.add_argument('--products-per-shipment', type=int, default=30)
+    parser.add_argument('--years', type=int, default=5)
+    parser.add_argument('--batch-size', type=int, default=IMPORT_BATCH_SIZE)
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--report-cache', action='store_true', help='keep the report cache enabled')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='JSON results file')
+    args = parser.parse_args()
+
+    if args.migrate:
+        migrate_test_database()
+    report = {
+        'started_at': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'revision': git_revision(),
+        'parameters': {name: value for name, value in vars(args).items() if name not in ('database_url', 'output')},
+        'results': asyncio.run(run(args)),
+    }
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, 'w') as file:
+            file.write(output + '\n')
+
+
+if __name__ == '__main__':
+    main()
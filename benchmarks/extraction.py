@@ -0,0 +1,113 @@
+from __future__ import annotations
+
+import argparse
+import os
+import resource
+import tempfile
+import time
+
+from benchmarks.pages import generate_pages
+from settings import save_path_temp_files
+from shipment_extractor import ENGINES
+from shipment_extractor import extract_shipments
+from shipment_extractor import ExtractionCache
+from shipment_extractor import ExtractionStats
+
+
+def run(shipments: list[str], directory: str, workers: int, engine: str) -> float:
+    started = time.perf_counter()
+    for _ in extract_shipments(shipments, directory, workers, engine):
+        pass
+    return time.perf_counter() - started
+
+
+def run_cached(shipments: list[str], directory: str, workers: int, engine: str) -> None:
+    """cold run filling a fresh extraction cache, then a warm run reading it"""
+    with tempfile.TemporaryDirectory() as cache_directory:
+        for name in ('cold', 'warm'):
+            with ExtractionCache(f'{cache_directory}/extraction_cache.sqlite3') as cache:
+                started = time.perf_counter()
+                for _ in extract_shipments(shipments, directory, workers, engine, cache=cache):
+                    pass
+                elapsed = time.perf_counter() - started
+                print(
+                    f'cache={name} engine={engine:<5} workers={workers:<3} time={elapsed:.2f}s '
+                    f'{len(shipments) / elapsed:.1f} pages/s {cache.report()}'
+                )
+
+
+def check(shipments: list[str], directory: str, engine: str) -> int:
+    """compares the engine output with the BeautifulSoup reference, returns mismatches count"""
+    mismatches = 0
+    reference = extract_shipments(shipments, directory, engine='bs4')
+    for expected, actual in zip(reference, extract_shipments(shipments, directory, engine=engine)):
+        if expected != actual:
+            mismatches += 1
+            print(f'{engine}: {actual["shipment_num"]} differs from bs4 output')
+    return mismatches
+
+
+def peak_rss_mb() -> tuple[float, float]:
+    """peak resident set size of this process and of the largest finished worker"""
+    to_mb = 1024 if os.uname().sysname != 'Darwin' else 1024 * 1024
+    return (
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / to_mb,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / to_mb,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Order page extraction throughput by engine and worker count')
+    parser.add_argument('--directory', default=save_path_temp_files)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, os.cpu_count() or 1])
+    parser.add_argument('--engines', nargs='+', choices=list(ENGINES), default=list(ENGINES))
+    parser.add_argument('--check', action='store_true', help='verify engines produce the bs4 output')
+    parser.add_argument('--fields', action='store_true', help='report selector hits, fallbacks, misses and time per field')
+    parser.add_argument('--cache', action='store_true', help='measure cold and warm extraction cache runs')
+    parser.add_argument(
+        '--generate', type=int, metavar='PAGES', help='write synthetic pages into the directory first'
+    )
+    parser.add_argument('--items-min', type=int, default=5)
+    parser.add_argument('--items-max', type=int, default=60)
+    args = parser.parse_args()
+
+    if args.generate and args.directory == save_path_temp_files:
+        parser.error('--generate needs a --directory other than the scraped pages one')
+    if args.generate:
+        generate_pages(args.directory, args.generate, args.items_min, args.items_max)
+    with open(f'{args.directory}/shipment_urls.txt') as file:
+        shipments = [line.rstrip().split('/')[-1] for line in file if line.strip()]
+
+    if args.check:
+        mismatches = sum(check(shipments, args.directory, engine) for engine in args.engines)
+        if mismatches:
+            raise SystemExit(f'{mismatches} pages differ from the bs4 output')
+
+    baseline = None
+    for engine in args.engines:
+        for workers in sorted(set(args.workers)):
+            elapsed = run(shipments, args.directory, workers, engine)
+            pages_per_second = len(shipments) / elapsed
+            baseline = baseline or pages_per_second
+            rss, workers_rss = peak_rss_mb()
+            print(
+                f'engine={engine:<5} workers={workers:<3} pages={len(shipments)} time={elapsed:.2f}s '
+                f'{pages_per_second:.1f} pages/s speed-up x{pages_per_second / baseline:.2f} '
+                f'peak rss={rss:.0f}MB workers rss={workers_rss:.0f}MB'
+            )
+
+    if args.cache:
+        for engine in args.engines:
+            run_cached(shipments, args.directory, max(args.workers), engine)
+
+    if args.fields:
+        for engine in args.engines:
+            stats = ExtractionStats()
+            for _ in extract_shipments(shipments, args.directory, engine=engine, stats=stats):
+                pass
+            print(f'engine={engine}')
+            print(stats.report())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+from __future__ import annotations
+
+import datetime
+import random
+from typing import Iterator
+
+from database.dal import CANCELLED_STATUSES
+from database.dal import DELIVERED_STATUS
+
+
+MERCHANTS = ['Метро', 'Лента', 'Ашан', 'ВкусВилл', 'Перекрёсток', 'Азбука вкуса']
+ADDRESSES = [f'Москва, ул. Тестовая, д. {house}' for house in range(1, 21)]
+STATUSES = [DELIVERED_STATUS] * 18 + [*CANCELLED_STATUSES, 'Частично отменён']
+PRODUCT_NAMES = [
+    f'{name} {variant}'
+    for name in ('Молоко', 'Хлеб', 'Сыр', 'Яблоки', 'Кофе', 'Курица', 'Йогурт', 'Рис', 'Чай', 'Бананы')
+    for variant in ('эконом', 'классический', 'фермерский', 'премиум', 'органический')
+]
+PRODUCT_STATUSES = ['Собран', 'Собран', 'Собран', 'Заменён', 'Нет в наличии']
+
+
+def generate_history(
+    shipments: int, products_per_shipment: int, years: int = 5, seed: int = 0
+) -> Iterator[tuple[str, dict]]:
+    """Yields (shipment_num, shipment_data) pairs shaped like the parser NDJSON
+    records, newest shipment first, ready for api.utils.build_import_batch"""
+    rng = random.Random(seed)
+    today = datetime.date.today()
+    days = max(1, years * 365)
+    for index in range(shipments):
+        shipment_date = today - datetime.timedelta(days=days * index // max(1, shipments))
+        products = {}
+        for product_id in range(1, rng.randint(1, 2 * products_per_shipment - 1) + 1):
+            if rng.random() < 0.3:
+                quantity = f'{rng.randint(0, 2)},{rng.randint(1, 9)} кг'
+            else:
+                quantity = f'{rng.randint(1, 5)} шт'
+            products[product_id] = {
+                'product_name': rng.choice(PRODUCT_NAMES),
+                'quantity': quantity,
+                'purchase_price': round(rng.uniform(30, 1500), 2),
+                'purchase_status': rng.choice(PRODUCT_STATUSES),
+            }
+        yield f'B{index:09d}', {
+            'shipment_merchant': rng.choice(MERCHANTS),
+            'shipment_status': rng.choice(STATUSES),
+            'shipment_date': f'{shipment_date.year}-{shipment_date.month:02}-{shipment_date.day}',
+            'shipping_address': rng.choice(ADDRESSES),
+            'shipping_cost': round(sum(product['purchase_price'] for product in products.values()), 2),
+            'bonuses': rng.randint(0, 300),
+            'assembly_and_delivery': rng.choice([0, 0, 99, 199, 299]),
+            'discount': round(rng.uniform(0, 200), 2) if rng.random() < 0.3 else 0,
+            'products': products,
+        }
@@ -0,0 +1,134 @@
+from __future__ import annotations
+
+import argparse
+import os
+import random
+from html import escape
+
+from benchmarks.history import ADDRESSES
+from benchmarks.history import MERCHANTS
+from benchmarks.history import PRODUCT_NAMES
+from benchmarks.history import PRODUCT_STATUSES
+from shipment_extractor import DICT_MONTHS
+
+
+MONTHS = list(DICT_MONTHS)
+PAGE_TEMPLATE = '''<!DOCTYPE html>
+<html lang="ru">
+<head><meta charset="utf-8"><title>Заказ {shipment_num}</title>
+<link rel="stylesheet" href="/_next/static/css/app.css"><script src="/_next/static/chunks/main.js"></script></head>
+<body>
+<div id="__next"><header class="Header_root__Qw1sT"><nav class="Header_nav__aB3x1">{navigation}</nav></header>
+<main class="styles_page__lN2pK">
+<section class="NewShipmentState_root__p0Fq2">
+{status}
+<p class="NewShipmentState_time__uJGKF">{day} {month}, {time}</p>
+</section>
+<section class="styles_details__kU1xO">
+<div class="order-goods-list__good-merchant">{merchant}</div>
+<div class="styles_address__Lf5gT"><span class="styles_textLarge__Vs7i4">{address}</span></div>
+<div class="styles_row__f3Nq9"><span class="styles_detailsText__Pnv_4 styles_bold__c8D1e" data-qa="user-shipment-total">{total}</span></div>
+<div class="styles_row__f3Nq9">{bonuses}</div>
+<div class="styles_row__f3Nq9"><span class="styles_total__9uFoP" data-qa="user-shipment-cost">{delivery}</span></div>
+<div class="styles_row__f3Nq9"><span class="styles_textPromo__StcD0" data-qa="user-shipment-product-discount">{discount}</span></div>
+</section>
+<section class="styles_assembly__Yt6aM">
+{items}
+</section>
+</main>
+<footer class="Footer_root__Zr0dE">{footer}</footer></div>
+</body>
+</html>
+'''
+ITEM_TEMPLATE = '''<div class="styles_assemblyItem__Kd2vO"><div class="styles_assemblyItemContent__o1cVR styles_withImage__a1Qe3">
+<img class="styles_image__R0aZp" src="/images/products/{image}.jpg" alt="">
+<div class="styles_info__m2RtS"><div class="styles_name__V0VHp">{name}</div>
+<div class="styles_quantity__JZCXN">{quantity}</div></div>
+<div class="styles_prices__Hu8dE"><div class="styles_currentPrice__Z3Whh">{price}</div>
+<div class="styles_oldPrice__Bc4qL">{old_price}</div></div>
+<div class="StatusBadge_root__X1eMz StatusBadge_md__U4hG8">{status}</div>
+</div></div>'''
+
+
+def format_price(value: float) -> str:
+    """prices as the site shows them: 1 234,50 ₽ with a non-breaking space"""
+    rubles, kopecks = f'{value:.2f}'.split('.')
+    groups = []
+    while rubles:
+        groups.insert(0, rubles[-3:])
+        rubles = rubles[:-3]
+    return '\xa0'.join(groups) + f',{kopecks} ₽'
+
+
+def generate_order_page(shipment_num: str, items: int, rng: random.Random) -> str:
+    """renders an order page with ``items`` products, using the class names
+    and data-qa attributes which shipment_extractor selectors look for"""
+    if rng.random() < 0.1:
+        status = '<div class="NewShipmentState_stateCalcelText__XDxWj">Заказ отменён</div>'
+    else:
+        status = '<p class="NewShipmentState_stateCompleteName__rKoqH">Заказ доставлен</p>'
+    bonuses = rng.randint(0, 300)
+    if rng.random() < 0.2:
+        bonuses_html = f'<span data-qa="loyalty-accrual">+{bonuses}</span>'
+    else:
+        bonuses_html = f'<span class="styles_textSmall__haByG" data-qa="loyalty-accrual">{bonuses}</span>'
+    prices = [round(rng.uniform(30, 1500), 2) for _ in range(items)]
+    products = []
+    for index, price in enumerate(prices):
+        if rng.random() < 0.3:
+            quantity = f'{rng.randint(0, 2)},{rng.randint(1, 9)} кг'
+        else:
+            quantity = f'{rng.randint(1, 5)} шт'
+        products.append(ITEM_TEMPLATE.format(
+            image=f'{shipment_num}-{index}',
+            name=escape(rng.choice(PRODUCT_NAMES)),
+            quantity=quantity,
+            price=format_price(price),
+            old_price=format_price(price * 1.2),
+            status=rng.choice(PRODUCT_STATUSES),
+        ))
+    return PAGE_TEMPLATE.format(
+        shipment_num=shipment_num,
+        navigation=''.join(f'<a class="Header_link__oP4t2" href="/c/{index}">Раздел {index}</a>' for index in range(20)),
+        status=status,
+        day=rng.randint(1, 28),
+        month=rng.choice(MONTHS),
+        time=f'{rng.randint(8, 22)}:{rng.choice(["00", "30"])}',
+        merchant=rng.choice(MERCHANTS),
+        address=escape(rng.choice(ADDRESSES)),
+        total=format_price(sum(prices)),
+        bonuses=bonuses_html,
+        delivery='бесплатно' if rng.random() < 0.3 else rng.choice([99, 199, 299]),
+        discount='-' + format_price(rng.uniform(0, 200)),
+        items='\n'.join(products),
+        footer=''.join(f'<p class="Footer_text__u7RtM">Строка {index}</p>' for index in range(10)),
+    )
+
+
+def generate_pages(directory: str, pages: int, items_min: int, items_max: int, seed: int = 0) -> list[str]:
+    """writes ``pages`` order pages and their shipment_urls.txt, returns shipment numbers"""
+    rng = random.Random(seed)
+    os.makedirs(directory, exist_ok=True)
+    shipments = [f'H{index:09d}' for index in range(pages)]
+    for shipment in shipments:
+        with open(f'{directory}/{shipment}.html', 'w') as page:
+            page.write(generate_order_page(shipment, rng.randint(items_min, items_max), rng))
+    with open(f'{directory}/shipment_urls.txt', 'w') as file:
+        for shipment in shipments:
+            file.write(f'/user/shipments/{shipment}\n')
+    return shipments
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Writes synthetic order pages for the extraction benchmark')
+    parser.add_argument('--directory', required=True, help='output directory, real pages there are overwritten')
+    parser.add_argument('--pages', type=int, default=500)
+    parser.add_argument('--items-min', type=int, default=5)
+    parser.add_argument('--items-max', type=int, default=60)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    generate_pages(args.directory, args.pages, args.items_min, args.items_max, args.seed)
+
+
+if __name__ == '__main__':
+    main()
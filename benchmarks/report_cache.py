@@ -0,0 +1,59 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+
+from api.cache import report_cache
+from database.session import dispose_engine
+from main import app
+
+
+async def measure(client: httpx.AsyncClient, params: dict, requests: int) -> list[float]:
+    latencies = []
+    for _ in range(requests):
+        started = time.perf_counter()
+        response = await client.get('/report/', params=params)
+        response.raise_for_status()
+        latencies.append(time.perf_counter() - started)
+    return latencies
+
+
+async def run(date_from: str, date_to: str, requests: int):
+    params = {'date_from': date_from, 'date_to': date_to}
+    ttl = report_cache.ttl
+    try:
+        async with httpx.AsyncClient(app=app, base_url='http://benchmark') as client:
+            report_cache.ttl = 0
+            uncached = await measure(client, params, requests)
+            report_cache.ttl = ttl or 60
+            report_cache.clear()
+            cached = await measure(client, params, requests)
+    finally:
+        report_cache.ttl = ttl
+        await dispose_engine()
+
+    for name, latencies in (('uncached', uncached), ('cached', cached)):
+        print(
+            f'{name:<9} requests={len(latencies)} '
+            f'mean={statistics.mean(latencies) * 1000:.2f}ms '
+            f'p50={statistics.median(latencies) * 1000:.2f}ms '
+            f'max={max(latencies) * 1000:.2f}ms'
+        )
+    print('cache', report_cache.stats())
+
+
+def main():
+    parser = argparse.ArgumentParser(description='GET /report latency with and without the report cache')
+    parser.add_argument('--date-from', default='2020-01-01')
+    parser.add_argument('--date-to', default='2030-01-01')
+    parser.add_argument('--requests', type=int, default=200)
+    args = parser.parse_args()
+    asyncio.run(run(args.date_from, args.date_to, args.requests))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,186 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import logging
+import os
+
+from api.actions import ImportRepository
+from api.utils import get_data_from_json
+from database.session import dispose_engine
+from database.session import SessionContextManager
+from progress import Progress
+from sbermarket_parser import download_shipment_pages
+from sbermarket_parser import get_data_from_shipment
+from sbermarket_parser import get_html_shipments
+from sbermarket_parser import get_known_shipments
+from sbermarket_parser import get_pending_shipments
+from sbermarket_parser import get_shipment_urls
+from sbermarket_parser import read_shipment_list
+from settings import DOWNLOAD_RETRIES
+from settings import DOWNLOAD_WORKERS
+from settings import EXTRACTION_CACHE
+from settings import EXTRACTION_ENGINE
+from settings import get_driver
+from settings import IMPORT_BATCH_SIZE
+from settings import INCREMENTAL_SCRAPING
+from settings import LOG_LEVEL
+from settings import PARSER_WORKERS
+from settings import save_path_temp_files
+from settings import temp_json_shipments
+from shipment_extractor import ENGINES
+
+
+def scrape_list(args: argparse.Namespace):
+    known_shipments = get_known_shipments(args.incremental)
+    print(f'{len(known_shipments)} shipments are already stored in a final state')
+    if args.dry_run:
+        return
+    os.makedirs(args.output, exist_ok=True)
+    driver = get_driver()
+    try:
+        with Progress('scrape-list') as progress:
+            get_html_shipments(driver, known_shipments, directory=args.output)
+            urls = get_shipment_urls(known_shipments, directory=args.output)
+            progress.advance(len(urls))
+    finally:
+        driver.quit()
+
+
+def fetch_pages(args: argparse.Namespace):
+    with open(args.input or f'{args.output}/shipment_urls.txt') as file:
+        shipment_urls = [line.rstrip() for line in file if line.strip()]
+    pending = get_pending_shipments(shipment_urls, args.output, args.resume)
+    print(f'{len(pending)} of {len(shipment_urls)} pages to download')
+    if args.dry_run or not pending:
+        return
+    os.makedirs(args.output, exist_ok=True)
+    with Progress('fetch-pages', total=len(pending)) as progress:
+        failed = download_shipment_pages(
+            shipment_urls,
+            workers=args.workers,
+            retries=args.retries,
+            directory=args.output,
+            resume=args.resume,
+            progress=progress,
+        )
+    if failed:
+        print('Failed to load:', ', '.join(failed))
+
+
+def extract(args: argparse.Namespace):
+    total = len(read_shipment_list(args.input))
+    with Progress('extract', total=total) as progress:
+        stats = get_data_from_shipment(
+            workers=args.workers,
+            engine=args.engine,
+            directory=args.input,
+            output_path=None if args.dry_run else args.output,
+            progress=progress,
+            # a dry run writes nothing, the extraction cache included
+            use_cache=args.cache and not args.dry_run,
+        )
+    print(stats.report())
+
+
+def load(args: argparse.Namespace):
+    with open(args.input) as file:
+        total = sum(1 for line in file if line.strip())
+
+    async def run():
+        try:
+            with Progress('load', total=total) as progress:
+                await get_data_from_json(
+                    batch_size=args.batch_size,
+                    path=args.input,
+                    upsert=args.upsert,
+                    dry_run=args.dry_run,
+                    progress=progress,
+                )
+        finally:
+            await dispose_engine()
+
+    asyncio.run(run())
+
+
+def refresh_rollup(args: argparse.Namespace):
+    if args.dry_run:
+        return
+
+    async def run():
+        try:
+            async with SessionContextManager() as session:
+                await ImportRepository._refresh_spending_daily(session)
+        finally:
+            await dispose_engine()
+
+    asyncio.run(run())
+    print('spending_daily is rebuilt from shipments')
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description='Sbermarket expenses import pipeline')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    json_path = f'{save_path_temp_files}/{temp_json_shipments}.ndjson'
+
+    command = subparsers.add_parser('scrape-list', help='save the shipments list page and shipment urls')
+    command.add_argument('--output', default=save_path_temp_files, help='pages directory')
+    command.add_argument(
+        '--incremental',
+        action=argparse.BooleanOptionalAction,
+        default=INCREMENTAL_SCRAPING,
+        help='stop at shipments already stored in a final state',
+    )
+    command.set_defaults(handler=scrape_list)
+
+    command = subparsers.add_parser('fetch-pages', help='download order pages of the saved urls')
+    command.add_argument('--input', help='urls file, shipment_urls.txt of the output directory by default')
+    command.add_argument('--output', default=save_path_temp_files, help='pages directory')
+    command.add_argument('--workers', type=int, default=DOWNLOAD_WORKERS)
+    command.add_argument('--retries', type=int, default=DOWNLOAD_RETRIES)
+    command.add_argument(
+        '--resume',
+        action=argparse.BooleanOptionalAction,
+        default=True,
+        help='skip pages which are already saved',
+    )
+    command.set_defaults(handler=fetch_pages)
+
+    command = subparsers.add_parser('extract', help='extract saved order pages into NDJSON')
+    command.add_argument('--input', default=save_path_temp_files, help='pages directory')
+    command.add_argument('--output', default=json_path, help='NDJSON file')
+    command.add_argument('--workers', type=int, default=PARSER_WORKERS)
+    command.add_argument('--engine', choices=list(ENGINES), default=EXTRACTION_ENGINE)
+    command.add_argument(
+        '--cache',
+        action=argparse.BooleanOptionalAction,
+        default=EXTRACTION_CACHE,
+        help='reuse records of unchanged pages from the extraction cache',
+    )
+    command.set_defaults(handler=extract)
+
+    command = subparsers.add_parser('load', help='load the NDJSON file into the database')
+    command.add_argument('--input', default=json_path, help='NDJSON file')
+    command.add_argument('--batch-size', type=int, default=IMPORT_BATCH_SIZE)
+    command.add_argument('--upsert', action='store_true', help='update changed shipments instead of inserting')
+    command.set_defaults(handler=load)
+
+    command = subparsers.add_parser(
+        'refresh-rollup',
+        help='rebuild the spending_daily rollup from shipments, e.g. after a TRUNCATE or a manual data fix',
+    )
+    command.set_defaults(handler=refresh_rollup)
+
+    for command in subparsers.choices.values():
+        command.add_argument('--dry-run', action='store_true', help='do the work without writing results')
+    return parser
+
+
+def main():
+    logging.basicConfig(level=LOG_LEVEL, format='%(asctime)s %(levelname)s %(name)s %(message)s')
+    args = build_parser().parse_args()
+    args.handler(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,17 +1,39 @@
 from __future__ import annotations
 
+import datetime
+import decimal
+from collections import Counter
+from typing import AsyncIterator
 from typing import Optional
 from typing import Sequence
 from uuid import UUID
 
+from sqlalchemy import cast
+from sqlalchemy import Date
 from sqlalchemy import delete
 from sqlalchemy import func
+from sqlalchemy import insert
+from sqlalchemy import literal_column
+from sqlalchemy import or_
+from sqlalchemy import Row
 from sqlalchemy import select
+from sqlalchemy import tuple_
 from sqlalchemy import update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
 
 from database.model import Products
 from database.model import Shipments
+from database.model import SpendingDaily
+
+
+SERVICE_COLUMNS = ('id', 'create_date', 'last_updated')
+PRODUCT_CONTENT_COLUMNS = ('product_name', 'quantity', 'quantity_unit', 'purchase_price', 'purchase_status')
+# asyncpg refuses statements with more bind parameters than this
+MAX_BIND_PARAMETERS = 32767
+DELIVERED_STATUS = 'Заказ доставлен'
+CANCELLED_STATUSES = ('Заказ отменён',)
 
 
 class ShipmentsDAL:
@@ -21,8 +43,9 @@ class ShipmentsDAL:
     async def create_shipment(
         self,
         shipment_num: str,
+        shipment_merchant: Optional[str],
         shipment_status: str,
-        shipment_date: str,
+        shipment_date: Optional[datetime.date],
         shipping_address: str,
         shipping_cost: float,
         bonuses: int,
@@ -31,6 +54,7 @@ class ShipmentsDAL:
     ) -> Shipments:
         new_shipment = Shipments(
             shipment_num=shipment_num,
+            shipment_merchant=shipment_merchant,
             shipment_status=shipment_status,
             shipment_date=shipment_date,
             shipping_address=shipping_address,
@@ -43,6 +67,42 @@ class ShipmentsDAL:
         await self.db_session.flush()
         return new_shipment
 
+    async def create_shipments_bulk(self, shipments: Sequence[dict]) -> None:
+        if shipments:
+            await self.db_session.execute(insert(Shipments), shipments)
+
+    async def upsert_shipments(self, shipments: Sequence[dict]) -> Sequence[str]:
+        """inserts new shipments and updates existing ones whose content changed,
+        returns numbers of the inserted or updated shipments"""
+        if not shipments:
+            return []
+        unique_shipments = list({shipment['shipment_num']: shipment for shipment in shipments}.values())
+        content_columns = [
+            column.name for column in Shipments.__table__.columns
+            if column.name not in SERVICE_COLUMNS and column.name != 'shipment_num'
+        ]
+        changed_shipment_nums = []
+        rows_per_query = MAX_BIND_PARAMETERS // len(Shipments.__table__.columns)
+        for start in range(0, len(unique_shipments), rows_per_query):
+            query = pg_insert(Shipments).values(unique_shipments[start:start + rows_per_query])
+            query = (
+                query.on_conflict_do_update(
+                    index_elements=[Shipments.shipment_num],
+                    set_={
+                        **{column: query.excluded[column] for column in content_columns},
+                        'last_updated': func.now(),
+                    },
+                    where=or_(*[
+                        Shipments.__table__.c[column].is_distinct_from(query.excluded[column])
+                        for column in content_columns
+                    ])
+                )
+                .returning(Shipments.shipment_num)
+            )
+            result = await self.db_session.scalars(query)
+            changed_shipment_nums.extend(result.all())
+        return changed_shipment_nums
+
     async def get_shipment_by_num(self, shipment_num: str) -> Optional[Shipments]:
         query = (
             select(Shipments)
@@ -54,35 +114,126 @@ class ShipmentsDAL:
             return shipmnet_row[0]
         return
 
-    async def update_shipment_by_num(self, shipment_num: str, **kwargs) -> Optional[UUID]:
+    async def get_final_shipment_nums(self) -> set[str]:
+        """numbers of delivered or cancelled shipments, which never change again"""
         query = (
-            update(Shipments)
+            select(Shipments.shipment_num)
+            .where(Shipments.shipment_status.in_([DELIVERED_STATUS, *CANCELLED_STATUSES]))
+        )
+        result = await self.db_session.scalars(query)
+        return set(result.all())
+
+    async def get_shipments_page(
+        self,
+        limit: int,
+        after: Optional[tuple[datetime.date, UUID]] = None,
+        shipment_status: Optional[str] = None,
+        date_from: Optional[datetime.date] = None,
+        date_to: Optional[datetime.date] = None,
+    ) -> Sequence[Shipments]:
+        """newest shipments first, paginated by the (shipment_date, id) keyset"""
+        query = (
+            select(Shipments)
+            .where(Shipments.shipment_date.is_not(None))
+            .order_by(Shipments.shipment_date.desc(), Shipments.id.desc())
+            .limit(limit)
+        )
+        if after is not None:
+            query = query.where(tuple_(Shipments.shipment_date, Shipments.id) < tuple_(*after))
+        if shipment_status is not None:
+            query = query.where(Shipments.shipment_status == shipment_status)
+        if date_from is not None:
+            query = query.where(Shipments.shipment_date >= date_from)
+        if date_to is not None:
+            query = query.where(Shipments.shipment_date <= date_to)
+        result = await self.db_session.scalars(query)
+        return result.all()
+
+    async def stream_shipments_with_products(
+        self,
+        shipment_nums: Optional[Sequence[str]] = None,
+        date_from: Optional[datetime.date] = None,
+        date_to: Optional[datetime.date] = None,
+        yield_per: int = 100,
+    ) -> AsyncIterator[Sequence[Shipments]]:
+        """yields shipments in chunks of ``yield_per`` from a server-side cursor, products
+        of every chunk are loaded with one extra IN query; requires a real transaction"""
+        query = (
+            select(Shipments)
+            .options(selectinload(Shipments.products))
+            .order_by(Shipments.shipment_date, Shipments.id)
+            .execution_options(yield_per=yield_per)
+        )
+        if shipment_nums:
+            query = query.where(Shipments.shipment_num.in_(shipment_nums))
+        if date_from is not None:
+            query = query.where(Shipments.shipment_date >= date_from)
+        if date_to is not None:
+            query = query.where(Shipments.shipment_date <= date_to)
+        result = await self.db_session.stream_scalars(query)
+        async for shipments in result.partitions():
+            yield shipments
+
+    async def stream_table_rows(
+        self,
+        model: type[Shipments] | type[Products],
+        date_from: Optional[datetime.date] = None,
+        date_to: Optional[datetime.date] = None,
+        yield_per: int = 1000,
+    ) -> AsyncIterator[Sequence[Row]]:
+        """yields table rows in chunks of ``yield_per`` from a server-side cursor, products
+        are filtered by the date of their shipment; requires a real transaction"""
+        query = select(*model.__table__.columns).execution_options(yield_per=yield_per)
+        if model is Products:
+            query = query.order_by(Products.shipment_num, Products.id)
+            if date_from is not None or date_to is not None:
+                query = query.join(Shipments, Products.shipment_num == Shipments.shipment_num)
+        else:
+            query = query.order_by(Shipments.shipment_date, Shipments.id)
+        if date_from is not None:
+            query = query.where(Shipments.shipment_date >= date_from)
+        if date_to is not None:
+            query = query.where(Shipments.shipment_date <= date_to)
+        result = await self.db_session.stream(query)
+        async for rows in result.partitions():
+            yield rows
+
+    async def update_shipment_by_num(self, shipment_num: str, **kwargs) -> Optional[Row]:
+        """returns (shipment_num, old_shipment_date, shipment_date) of the updated shipment"""
+        old_shipment = (
+            select(Shipments.id, Shipments.shipment_date.label('old_shipment_date'))
             .where(Shipments.shipment_num == shipment_num)
+            .subquery()
+        )
+        query = (
+            update(Shipments)
+            .where(Shipments.id == old_shipment.c.id)
             .values(kwargs)
-            .returning(Shipments.shipment_num)
+            .returning(Shipments.shipment_num, old_shipment.c.old_shipment_date, Shipments.shipment_date)
         )
         result = await self.db_session.execute(query)
-        updated_shipment_row = result.fetchone()
-        if updated_shipment_row is not None:
-            return updated_shipment_row[0]
-        return
+        return result.fetchone()
 
-    async def delete_shipment_by_num(self, shipment_num: str) -> Optional[UUID]:
+    async def delete_shipment_by_num(self, shipment_num: str, cascade: bool = False) -> Optional[Row]:
+        """returns (shipment_num, shipment_date) of the deleted shipment,
+        with ``cascade`` deletes its products first"""
+        if cascade:
+            await self.db_session.execute(
+                delete(Products).where(Products.shipment_num == shipment_num)
+            )
         query = (
             delete(Shipments)
             .where(Shipments.shipment_num == shipment_num)
-            .returning(Shipments.shipment_num)
+            .returning(Shipments.shipment_num, Shipments.shipment_date)
         )
         result = await self.db_session.execute(query)
-        deleted_shipment_rows = result.fetchone()
-        if deleted_shipment_rows is not None:
-            return deleted_shipment_rows[0]
-        return
+        return result.fetchone()
 
     async def create_product(
         self,
         product_name: str,
-        quantity: str,
+        quantity: Optional[decimal.Decimal],
+        quantity_unit: Optional[str],
         purchase_price: float,
         purchase_status: str,
         shipment_num: str
@@ -90,6 +241,7 @@ class ShipmentsDAL:
         new_product = Products(
             product_name=product_name,
             quantity=quantity,
+            quantity_unit=quantity_unit,
             purchase_price=purchase_price,
             purchase_status=purchase_status,
             shipment_num=shipment_num
@@ -98,6 +250,62 @@ class ShipmentsDAL:
         await self.db_session.flush()
         return new_product
 
+    async def create_products_bulk(self, products: Sequence[dict]) -> None:
+        if products:
+            await self.db_session.execute(insert(Products), products)
+
+    async def create_products_returning(self, products: Sequence[dict]) -> Sequence[Products]:
+        if not products:
+            return []
+        result = await self.db_session.scalars(
+            insert(Products).returning(Products, sort_by_parameter_order=True), products
+        )
+        return result.all()
+
+    async def get_existing_product_ids(self, product_ids: Sequence[UUID]) -> set[UUID]:
+        if not product_ids:
+            return set()
+        result = await self.db_session.scalars(
+            select(Products.id).where(Products.id.in_(product_ids))
+        )
+        return set(result.all())
+
+    async def update_products_bulk(self, products: Sequence[dict]) -> None:
+        """executemany UPDATE by primary key, every dict holds the product id and changed values"""
+        if products:
+            await self.db_session.execute(update(Products), products)
+
+    async def get_shipments_with_changed_products(
+        self, shipment_nums: Sequence[str], products: Sequence[dict]
+    ) -> set[str]:
+        """numbers of the given shipments whose stored products differ from the passed ones"""
+        if not shipment_nums:
+            return set()
+        incoming: dict[str, Counter] = {shipment_num: Counter() for shipment_num in shipment_nums}
+        for product in products:
+            if product['shipment_num'] in incoming:
+                incoming[product['shipment_num']][tuple(product[column] for column in PRODUCT_CONTENT_COLUMNS)] += 1
+        stored: dict[str, Counter] = {shipment_num: Counter() for shipment_num in shipment_nums}
+        query = (
+            select(Products.shipment_num, *[Products.__table__.c[column] for column in PRODUCT_CONTENT_COLUMNS])
+            .where(Products.shipment_num.in_(shipment_nums))
+        )
+        for shipment_num, *content in await self.db_session.execute(query):
+            stored[shipment_num][tuple(content)] += 1
+        return {shipment_num for shipment_num in shipment_nums if stored[shipment_num] != incoming[shipment_num]}
+
+    async def replace_products(self, shipment_nums: Sequence[str], products: Sequence[dict]) -> None:
+        """replaces all products of the given shipments with the passed ones"""
+        if not shipment_nums:
+            return
+        await self.db_session.execute(
+            delete(Products).where(Products.shipment_num.in_(shipment_nums))
+        )
+        shipment_nums = set(shipment_nums)
+        await self.create_products_bulk(
+            [product for product in products if product['shipment_num'] in shipment_nums]
+        )
+
     async def get_products_by_shipment_num(self, shipment_num: str) -> Optional[Sequence]:
         query = (
             select(Products)
@@ -134,15 +342,15 @@ class ShipmentsDAL:
             return deleted_product_rows
         return
 
-    async def get_spending_report(self, date_from: str, date_to: str) -> dict:
+    async def get_spending_report(self, date_from: datetime.date, date_to: datetime.date) -> dict:
         query = (
             select(
-                func.count(Shipments.shipment_num),
-                func.sum(Shipments.shipping_cost),
-                func.sum(Shipments.shipping_cost) + func.sum(Shipments.bonuses)
+                func.coalesce(func.sum(SpendingDaily.shipments_count), 0),
+                func.coalesce(func.sum(SpendingDaily.shipping_cost), 0),
+                func.coalesce(func.sum(SpendingDaily.shipping_cost) + func.sum(SpendingDaily.bonuses), 0)
             )
-            .where(Shipments.shipment_date.between(date_from, date_to))
-            .where(Shipments.shipment_status == 'Заказ доставлен')
+            .where(SpendingDaily.shipment_date.between(date_from, date_to))
+            .where(SpendingDaily.shipment_status == DELIVERED_STATUS)
         )
         result = await self.db_session.execute(query)
         report_row = result.fetchone()
@@ -155,3 +363,97 @@ class ShipmentsDAL:
                 )
             }
         return {'report': 'Ошибка в формировании отчёта.'}
+
+    async def get_spending_breakdown(
+        self,
+        date_from: datetime.date,
+        date_to: datetime.date,
+        group_by: str,
+        limit: int,
+        offset: int,
+        top_products: int,
+    ) -> dict:
+        if group_by in ('month', 'week'):
+            group_key = cast(
+                func.date_trunc(literal_column(f"'{group_by}'"), Shipments.shipment_date), Date
+            )
+            order_by = (group_key,)
+        else:
+            group_key = Shipments.shipping_address if group_by == 'address' else Shipments.shipment_merchant
+            # groups with equal spend need a stable order to page through
+            order_by = (func.sum(Shipments.shipping_cost).desc(), group_key)
+        groups_query = (
+            select(
+                group_key,
+                func.count(Shipments.shipment_num),
+                func.sum(Shipments.shipping_cost),
+                func.sum(Shipments.shipping_cost) + func.coalesce(func.sum(Shipments.bonuses), 0),
+            )
+            .where(Shipments.shipment_date.between(date_from, date_to))
+            .where(Shipments.shipment_status == DELIVERED_STATUS)
+            .group_by(group_key)
+        )
+        # counted apart from the page, an offset past the last group still gets the total
+        total_groups = await self.db_session.scalar(
+            select(func.count()).select_from(groups_query.subquery())
+        )
+        groups_result = await self.db_session.execute(
+            groups_query.order_by(*order_by).limit(limit).offset(offset)
+        )
+        group_rows = groups_result.all()
+
+        top_products_rows = []
+        if top_products:
+            product_spent = func.coalesce(func.sum(Products.purchase_price), 0).label('spent')
+            top_products_query = (
+                select(
+                    Products.product_name,
+                    func.count(Products.id),
+                    product_spent,
+                )
+                .join(Shipments, Shipments.shipment_num == Products.shipment_num)
+                .where(Shipments.shipment_date.between(date_from, date_to))
+                .where(Shipments.shipment_status == DELIVERED_STATUS)
+                .group_by(Products.product_name)
+                .order_by(product_spent.desc())
+                .limit(top_products)
+            )
+            top_products_result = await self.db_session.execute(top_products_query)
+            top_products_rows = top_products_result.all()
+
+        return {
+            'total_groups': total_groups,
+            'groups': [
+                {
+                    'key': str(key) if key is not None else None,
+                    'shipments_count': shipments_count,
+                    'spent': round(spent, 2),
+                    'spent_with_bonuses': round(spent_with_bonuses, 2),
+                }
+                for key, shipments_count, spent, spent_with_bonuses in group_rows
+            ],
+            'top_products': [
+                {'product_name': product_name, 'purchases': purchases, 'spent': round(spent, 2)}
+                for product_name, purchases, spent in top_products_rows
+            ],
+        }
+
+    async def refresh_spending_daily(self) -> None:
+        """rebuilds the rollup from shipments, e.g. after a TRUNCATE which the trigger does not see"""
+        shipment_status = func.coalesce(Shipments.shipment_status, literal_column("''"))
+        await self.db_session.execute(delete(SpendingDaily))
+        await self.db_session.execute(
+            insert(SpendingDaily).from_select(
+                ['id', 'shipment_date', 'shipment_status', 'shipments_count', 'shipping_cost', 'bonuses'],
+                select(
+                    func.gen_random_uuid(),
+                    Shipments.shipment_date,
+                    shipment_status,
+                    func.count(),
+                    func.sum(Shipments.shipping_cost),
+                    func.sum(func.coalesce(Shipments.bonuses, 0)),
+                )
+                .where(Shipments.shipment_date.is_not(None))
+                .group_by(Shipments.shipment_date, shipment_status)
+            )
+        )
@@ -0,0 +1,78 @@
+from __future__ import annotations
+
+import time
+
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlalchemy.pool import ConnectionPoolEntry
+
+from database.query_log import query_stats
+
+
+class PoolMetrics:
+    def __init__(self):
+        self.reset()
+
+    def reset(self) -> None:
+        self.checkouts = 0
+        self.checkout_wait_seconds = 0.0
+        self.max_checkout_wait_seconds = 0.0
+        self.checkins = 0
+        self.checkout_held_seconds = 0.0
+        self.max_checkout_held_seconds = 0.0
+
+    def observe_wait(self, seconds: float) -> None:
+        self.checkouts += 1
+        self.checkout_wait_seconds += seconds
+        self.max_checkout_wait_seconds = max(self.max_checkout_wait_seconds, seconds)
+
+    def observe_held(self, seconds: float) -> None:
+        self.checkins += 1
+        self.checkout_held_seconds += seconds
+        self.max_checkout_held_seconds = max(self.max_checkout_held_seconds, seconds)
+
+    def snapshot(self, pool: AsyncAdaptedQueuePool | None = None) -> dict:
+        snapshot = {
+            'checkouts': self.checkouts,
+            'checkout_wait_seconds': self.checkout_wait_seconds,
+            'max_checkout_wait_seconds': self.max_checkout_wait_seconds,
+            'avg_checkout_wait_seconds': (
+                self.checkout_wait_seconds / self.checkouts if self.checkouts else 0.0
+            ),
+            'checkins': self.checkins,
+            'checkout_held_seconds': self.checkout_held_seconds,
+            'max_checkout_held_seconds': self.max_checkout_held_seconds,
+            'pool_size': None,
+            'checked_out': None,
+            'overflow': None,
+        }
+        if pool is not None:
+            snapshot.update(
+                pool_size=pool.size(),
+                checked_out=pool.checkedout(),
+                overflow=pool.overflow(),
+            )
+        return snapshot
+
+
+pool_metrics = PoolMetrics()
+
+
+class TimedAsyncQueuePool(AsyncAdaptedQueuePool):
+    """AsyncAdaptedQueuePool that records checkout wait and hold times"""
+
+    def _do_get(self) -> ConnectionPoolEntry:
+        started = time.perf_counter()
+        record = super()._do_get()
+        now = time.perf_counter()
+        pool_metrics.observe_wait(now - started)
+        stats = query_stats.get()
+        if stats is not None:
+            stats.pool_wait_seconds += now - started
+        record.info['checked_out_at'] = now
+        return record
+
+    def _do_return_conn(self, record: ConnectionPoolEntry) -> None:
+        checked_out_at = record.info.pop('checked_out_at', None)
+        if checked_out_at is not None:
+            pool_metrics.observe_held(time.perf_counter() - checked_out_at)
+        super()._do_return_conn(record)
@@ -1,10 +1,13 @@
 from __future__ import annotations
 
 import datetime
+import decimal
 import uuid
 from typing import Optional
 
 from sqlalchemy import ForeignKey
+from sqlalchemy import Index
+from sqlalchemy import UniqueConstraint
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.dialects.postgresql import VARCHAR
 from sqlalchemy.orm import DeclarativeBase
@@ -12,9 +15,11 @@ from sqlalchemy.orm import Mapped
 from sqlalchemy.orm import mapped_column
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
+from sqlalchemy.types import Date
 from sqlalchemy.types import DateTime
 from sqlalchemy.types import Float
 from sqlalchemy.types import Integer
+from sqlalchemy.types import Numeric
 from sqlalchemy.types import String
 
 
@@ -24,6 +29,8 @@ class Base(DeclarativeBase):
     type_annotation_map = {
         int: Integer(),
         float: Float(),
+        decimal.Decimal: Numeric(10, 3),
+        datetime.date: Date(),
         datetime.datetime: DateTime(timezone=True),
         str: String().with_variant(VARCHAR, 'postgresql'),
         uuid.UUID: UUID(as_uuid=True)
@@ -46,24 +53,46 @@ class Base(DeclarativeBase):
 
 class Shipments(Base):
     __tablename__ = 'shipments'
+    __table_args__ = (
+        Index('ix_shipments_status_date', 'shipment_status', 'shipment_date'),
+        Index('ix_shipments_date_id', 'shipment_date', 'id'),
+    )
 
     shipment_num: Mapped[str] = mapped_column(unique=True, nullable=False)
+    shipment_merchant: Mapped[Optional[str]]
     shipment_status: Mapped[Optional[str]]
-    shipment_date: Mapped[Optional[str]]
+    shipment_date: Mapped[Optional[datetime.date]]
     shipping_address: Mapped[Optional[str]]
     shipping_cost: Mapped[float] = mapped_column(nullable=False)
     bonuses: Mapped[Optional[int]]
     assembly_and_delivery: Mapped[Optional[int]]
     discount: Mapped[Optional[float]]
-    products: Mapped['Products'] = relationship(back_populates='shipment')
+    products: Mapped[list['Products']] = relationship(back_populates='shipment')
 
 
 class Products(Base):
     __tablename__ = 'products'
 
     product_name: Mapped[Optional[str]]
-    quantity: Mapped[Optional[str]]
+    quantity: Mapped[Optional[decimal.Decimal]]
+    quantity_unit: Mapped[Optional[str]]
     purchase_price: Mapped[Optional[float]]
     purchase_status: Mapped[Optional[str]]
-    shipment_num: Mapped[str] = mapped_column(ForeignKey('shipments.shipment_num'))
+    shipment_num: Mapped[str] = mapped_column(ForeignKey('shipments.shipment_num'), index=True)
     shipment: Mapped['Shipments'] = relationship(back_populates='products')
+
+
+class SpendingDaily(Base):
+    """Per day and status rollup of shipments, maintained by the
+    shipments_spending_daily trigger (see migrations)"""
+
+    __tablename__ = 'spending_daily'
+    __table_args__ = (
+        UniqueConstraint('shipment_date', 'shipment_status'),
+    )
+
+    shipment_date: Mapped[datetime.date] = mapped_column(nullable=False)
+    shipment_status: Mapped[str] = mapped_column(nullable=False)
+    shipments_count: Mapped[int] = mapped_column(nullable=False)
+    shipping_cost: Mapped[float] = mapped_column(nullable=False)
+    bonuses: Mapped[int] = mapped_column(nullable=False)
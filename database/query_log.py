@@ -0,0 +1,68 @@
+from __future__ import annotations
+
+import logging
+import random
+import time
+from contextvars import ContextVar
+from typing import Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from settings import QUERY_LOG_SAMPLE_RATE
+from settings import SLOW_QUERY_THRESHOLD
+
+
+logger = logging.getLogger('database.queries')
+
+
+class QueryStats:
+    """Statements executed on behalf of one request or task"""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.pool_wait_seconds = 0.0
+
+    def observe(self, seconds: float) -> None:
+        self.count += 1
+        self.seconds += seconds
+
+
+query_stats: ContextVar[Optional[QueryStats]] = ContextVar('query_stats', default=None)
+
+
+def track_queries() -> QueryStats:
+    """starts counting the statements of the current context, SQLAlchemy runs
+    the cursor events in the context of the awaiting task"""
+    stats = QueryStats()
+    query_stats.set(stats)
+    return stats
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started_at', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info['query_started_at'].pop()
+    stats = query_stats.get()
+    if stats is not None:
+        stats.observe(elapsed)
+    if SLOW_QUERY_THRESHOLD > 0 and elapsed >= SLOW_QUERY_THRESHOLD:
+        logger.warning(
+            'slow_query duration_ms=%.1f executemany=%s statement=%r parameters=%.500r',
+            elapsed * 1000, executemany, statement, parameters
+        )
+    elif QUERY_LOG_SAMPLE_RATE > 0 and random.random() < QUERY_LOG_SAMPLE_RATE:
+        logger.info(
+            'query duration_ms=%.1f executemany=%s statement=%r',
+            elapsed * 1000, executemany, statement
+        )
+
+
+def install_query_logging(engine: Engine) -> None:
+    """times every statement of the engine for the slow query log, the sampled
+    query log and per-request query counts"""
+    event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
@@ -4,27 +4,71 @@ from typing import AsyncGenerator
 from typing import Optional
 
 from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlalchemy.ext.asyncio import AsyncEngine
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.ext.asyncio import create_async_engine
 
+from database.metrics import TimedAsyncQueuePool
+from database.query_log import install_query_logging
 from settings import DATABASE_URL
+from settings import DB_ECHO
+from settings import DB_MAX_OVERFLOW
+from settings import DB_POOL_PRE_PING
+from settings import DB_POOL_RECYCLE
+from settings import DB_POOL_SIZE
+from settings import DB_POOL_TIMEOUT
 
 
-class SessionContextManager:
-    def __init__(self):
-        self.engine = create_async_engine(
-            DATABASE_URL,
+engine: Optional[AsyncEngine] = None
+async_session: Optional[async_sessionmaker[AsyncSession]] = None
+
+
+def init_engine(database_url: str = DATABASE_URL) -> AsyncEngine:
+    """creates the process-wide engine and its connection pool once"""
+    global engine, async_session
+    if engine is None:
+        engine = create_async_engine(
+            database_url,
             future=True,
-            echo=True,
+            echo=DB_ECHO,
             execution_options={'isolation_level': 'AUTOCOMMIT'},
+            poolclass=TimedAsyncQueuePool,
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+            pool_recycle=DB_POOL_RECYCLE,
+            pool_pre_ping=DB_POOL_PRE_PING,
         )
-        self.async_session: AsyncSession = async_sessionmaker(self.engine, expire_on_commit=False, class_=AsyncSession)
+        install_query_logging(engine.sync_engine)
+        async_session = async_sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
+    return engine
+
+
+async def dispose_engine() -> None:
+    global engine, async_session
+    if engine is not None:
+        await engine.dispose()
+    engine = None
+    async_session = None
+
+
+async def enable_transaction(session: AsyncSession, isolation_level: str = 'READ COMMITTED') -> None:
+    """turns AUTOCOMMIT off for the session's connection, so that the enclosing
+    session.begin() block is a real database transaction"""
+    await session.connection(execution_options={'isolation_level': isolation_level})
+
+
+class SessionContextManager:
+    def __init__(self):
+        if async_session is None:
+            init_engine()
+        self.session: AsyncSession = async_session()
 
-    async def __aenter__(self):
-        return self.async_session()
+    async def __aenter__(self) -> AsyncSession:
+        return self.session
 
     async def __aexit__(self, exc_type, exc_value, traceback):
-        await self.async_session().close()
+        await self.session.close()
 
 
 async def get_async_session() -> Optional[AsyncGenerator]:
@@ -1,22 +1,44 @@
 from __future__ import annotations
 
+import logging
+from contextlib import asynccontextmanager
+
 import uvicorn
 from fastapi import APIRouter
 from fastapi import FastAPI
 
+from api.handlers import export_router
+from api.handlers import metrics_router
 from api.handlers import product_router
 from api.handlers import report_router
 from api.handlers import shipment_router
+from api.metrics import RequestMetricsMiddleware
+from database.session import dispose_engine
+from database.session import init_engine
+from settings import LOG_LEVEL
+
+
+logging.basicConfig(level=LOG_LEVEL, format='%(asctime)s %(levelname)s %(name)s %(message)s')
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    init_engine()
+    yield
+    await dispose_engine()
 
 
-app = FastAPI(title='food-expenses')  # noqa: pylint=invalid-name
+app = FastAPI(title='food-expenses', lifespan=lifespan)  # noqa: pylint=invalid-name
 
 main_router = APIRouter()
 main_router.include_router(shipment_router, prefix='/shipment', tags=['shipment'])
 main_router.include_router(product_router, prefix='/product', tags=['product'])
 main_router.include_router(report_router, prefix='/report', tags=['report'])
+main_router.include_router(export_router, prefix='/export', tags=['export'])
+main_router.include_router(metrics_router, prefix='/metrics', tags=['metrics'])
 
 app.include_router(main_router)
+app.add_middleware(RequestMetricsMiddleware)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,90 @@
+"""Spending daily rollup
+
+Revision ID: 584093991baa
+Revises: e9973a9f92b8
+Create Date: 2026-10-18 13:00:00.000000
+
+"""
+from __future__ import annotations
+
+from typing import Sequence
+from typing import Union
+
+import sqlalchemy as sa
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '584093991baa'
+down_revision: Union[str, None] = 'e9973a9f92b8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('spending_daily',
+    sa.Column('shipment_date', sa.Date(), nullable=False),
+    sa.Column('shipment_status', sa.String().with_variant(sa.VARCHAR(), 'postgresql'), nullable=False),
+    sa.Column('shipments_count', sa.Integer(), nullable=False),
+    sa.Column('shipping_cost', sa.Float(), nullable=False),
+    sa.Column('bonuses', sa.Integer(), nullable=False),
+    sa.Column('id', sa.UUID(), nullable=False),
+    sa.Column('create_date', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.Column('last_updated', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('shipment_date', 'shipment_status')
+    )
+    op.execute("""
+        CREATE FUNCTION spending_daily_apply() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.shipment_date IS NOT NULL THEN
+                UPDATE spending_daily SET
+                    shipments_count = shipments_count - 1,
+                    shipping_cost = shipping_cost - OLD.shipping_cost,
+                    bonuses = bonuses - coalesce(OLD.bonuses, 0),
+                    last_updated = now()
+                WHERE shipment_date = OLD.shipment_date
+                    AND shipment_status = coalesce(OLD.shipment_status, '');
+                DELETE FROM spending_daily
+                WHERE shipment_date = OLD.shipment_date
+                    AND shipment_status = coalesce(OLD.shipment_status, '')
+                    AND shipments_count <= 0;
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.shipment_date IS NOT NULL THEN
+                INSERT INTO spending_daily AS daily
+                    (id, shipment_date, shipment_status, shipments_count, shipping_cost, bonuses)
+                VALUES (
+                    gen_random_uuid(), NEW.shipment_date, coalesce(NEW.shipment_status, ''),
+                    1, NEW.shipping_cost, coalesce(NEW.bonuses, 0)
+                )
+                ON CONFLICT (shipment_date, shipment_status) DO UPDATE SET
+                    shipments_count = daily.shipments_count + 1,
+                    shipping_cost = daily.shipping_cost + excluded.shipping_cost,
+                    bonuses = daily.bonuses + excluded.bonuses,
+                    last_updated = now();
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE TRIGGER shipments_spending_daily
+        AFTER INSERT OR DELETE OR UPDATE OF shipment_date, shipment_status, shipping_cost, bonuses
+        ON shipments
+        FOR EACH ROW EXECUTE FUNCTION spending_daily_apply()
+    """)
+    op.execute("""
+        INSERT INTO spending_daily
+            (id, shipment_date, shipment_status, shipments_count, shipping_cost, bonuses)
+        SELECT gen_random_uuid(), shipment_date, coalesce(shipment_status, ''),
+            count(*), sum(shipping_cost), sum(coalesce(bonuses, 0))
+        FROM shipments
+        WHERE shipment_date IS NOT NULL
+        GROUP BY shipment_date, coalesce(shipment_status, '')
+    """)
+
+
+def downgrade() -> None:
+    op.execute('DROP TRIGGER shipments_spending_daily ON shipments')
+    op.execute('DROP FUNCTION spending_daily_apply()')
+    op.drop_table('spending_daily')
@@ -0,0 +1,70 @@
+"""Typed columns and report indexes
+
+Revision ID: e9973a9f92b8
+Revises: 17caba9a8c79
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from __future__ import annotations
+
+from typing import Sequence
+from typing import Union
+
+import sqlalchemy as sa
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e9973a9f92b8'
+down_revision: Union[str, None] = '17caba9a8c79'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # parser dates look like 2023-09-5, incomplete ones like 2023-None-5 become NULL
+    op.alter_column(
+        'shipments', 'shipment_date',
+        existing_type=sa.VARCHAR(),
+        type_=sa.Date(),
+        existing_nullable=True,
+        postgresql_using=(
+            "CASE WHEN shipment_date ~ '^\\d{4}-\\d{1,2}-\\d{1,2}$' "
+            "THEN to_date(shipment_date, 'YYYY-MM-DD') END"
+        ),
+    )
+    # quantities look like '2 шт' or '0,5 кг'
+    op.add_column('products', sa.Column('quantity_unit', sa.String().with_variant(sa.VARCHAR(), 'postgresql'), nullable=True))
+    op.execute(
+        "UPDATE products SET quantity_unit = "
+        "NULLIF(btrim(regexp_replace(quantity, '^\\s*\\d+([.,]\\d+)?', '')), '')"
+    )
+    op.alter_column(
+        'products', 'quantity',
+        existing_type=sa.VARCHAR(),
+        type_=sa.Numeric(10, 3),
+        existing_nullable=True,
+        postgresql_using="replace(substring(quantity from '^\\s*(\\d+(?:[.,]\\d+)?)'), ',', '.')::numeric",
+    )
+    op.create_index('ix_shipments_status_date', 'shipments', ['shipment_status', 'shipment_date'], unique=False)
+    op.create_index(op.f('ix_products_shipment_num'), 'products', ['shipment_num'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_products_shipment_num'), table_name='products')
+    op.drop_index('ix_shipments_status_date', table_name='shipments')
+    op.alter_column(
+        'products', 'quantity',
+        existing_type=sa.Numeric(10, 3),
+        type_=sa.VARCHAR(),
+        existing_nullable=True,
+        postgresql_using="NULLIF(concat_ws(' ', quantity::text, quantity_unit), '')",
+    )
+    op.drop_column('products', 'quantity_unit')
+    op.alter_column(
+        'shipments', 'shipment_date',
+        existing_type=sa.Date(),
+        type_=sa.VARCHAR(),
+        existing_nullable=True,
+        postgresql_using="to_char(shipment_date, 'YYYY-MM-DD')",
+    )
@@ -0,0 +1,55 @@
+from __future__ import annotations
+
+import time
+from threading import Lock
+from typing import Optional
+
+
+class Progress:
+    """Prints processed items count, throughput and ETA of a pipeline stage.
+
+    ``advance`` may be called from several threads; a line is printed at most
+    once per ``interval`` seconds and once more on ``finish``.
+    """
+
+    def __init__(self, label: str, total: Optional[int] = None, interval: float = 1.0):
+        self.label = label
+        self.total = total
+        self.interval = interval
+        self.done = 0
+        self.started = time.perf_counter()
+        self.printed = self.started
+        self.lock = Lock()
+
+    def __enter__(self) -> Progress:
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.finish()
+
+    def advance(self, items: int = 1) -> None:
+        with self.lock:
+            self.done += items
+            now = time.perf_counter()
+            if now - self.printed >= self.interval:
+                self.printed = now
+                print(self.format(now))
+
+    def finish(self) -> None:
+        with self.lock:
+            print(self.format(time.perf_counter(), finished=True))
+
+    def format(self, now: float, finished: bool = False) -> str:
+        elapsed = now - self.started
+        rate = self.done / elapsed if elapsed > 0 else 0.0
+        done = f'{self.done}/{self.total}' if self.total is not None else str(self.done)
+        line = f'{self.label}: {done} items, {rate:.1f} items/s, elapsed {format_duration(elapsed)}'
+        if not finished and self.total is not None and rate > 0:
+            line += f', ETA {format_duration((self.total - self.done) / rate)}'
+        return line
+
+
+def format_duration(seconds: float) -> str:
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f'{hours}:{minutes:02}:{seconds:02}' if hours else f'{minutes}:{seconds:02}'
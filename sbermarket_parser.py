@@ -1,57 +1,225 @@
 from __future__ import annotations
 
+import asyncio
 import json
+import os
+import shutil
 import time
-from datetime import date
+from contextlib import ExitStack
+from queue import Empty
+from queue import Queue
+from threading import Thread
+from typing import Callable
+from typing import Optional
 
 from bs4 import BeautifulSoup
 from selenium.common import NoSuchElementException
 from selenium.common import StaleElementReferenceException
 from selenium.common import TimeoutException
 from selenium.webdriver import ActionChains
-from selenium.webdriver.common.actions.wheel_input import ScrollOrigin
 from selenium.webdriver.common.by import By
-from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.support.wait import WebDriverWait
 
+from api.actions import ShipmentRepository
+from database.session import dispose_engine
+from database.session import SessionContextManager
+from progress import Progress
+from settings import DOWNLOAD_RETRIES
+from settings import DOWNLOAD_WORKERS
+from settings import EXTRACTION_CACHE
+from settings import EXTRACTION_ENGINE
 from settings import get_driver
+from settings import INCREMENTAL_SCRAPING
+from settings import LOAD_MORE_TIMEOUT
+from settings import PARSER_WORKERS
 from settings import save_path_temp_files
 from settings import sbermarket_url
 from settings import temp_json_shipments
+from settings import user_data_directory
+from shipment_extractor import extract_shipments
+from shipment_extractor import ExtractionCache
+from shipment_extractor import ExtractionStats
 
 
-driver = get_driver()
+def get_known_shipments(incremental: bool = INCREMENTAL_SCRAPING) -> set[str]:
+    """shipments already stored in the database in a final state"""
+    if not incremental:
+        return set()
 
+    async def fetch() -> set[str]:
+        try:
+            async with SessionContextManager() as session:
+                return await ShipmentRepository._get_final_shipment_nums(session)
+        finally:
+            await dispose_engine()
+
+    return asyncio.run(fetch())
 
-def get_html_shipments():
+
+def get_html_shipments(
+    driver, known_shipments: Optional[set[str]] = None, directory: str = save_path_temp_files
+):
     load_more_shipments_button_class = 'LoadMoreShipmentsButton_loadMoreShipments__aa47z'
+    shipment_links_selector = '.styles_list___dvv1 a'
+
+    def reached_known_shipment() -> bool:
+        links = driver.find_elements(By.CSS_SELECTOR, shipment_links_selector)
+        return bool(links) and (links[-1].get_attribute('href') or '').rstrip('/').split('/')[-1] in known_shipments
+
     driver.maximize_window()
     driver.get(sbermarket_url)
-    scrolling_and_save_pages(load_more_shipments_button_class, file_name='shipments')
+    scrolling_and_save_pages(
+        driver,
+        load_more_shipments_button_class,
+        file_name='shipments',
+        directory=directory,
+        items_selector=shipment_links_selector,
+        should_stop=reached_known_shipment if known_shipments else None,
+    )
+
+
+def get_html_shipment(workers: int = DOWNLOAD_WORKERS):
+    with open(f'{save_path_temp_files}/shipment_urls.txt') as file:
+        shipment_urls = [line.rstrip() for line in file if line.strip()]
+    failed = download_shipment_pages(shipment_urls, workers=workers)
+    if failed:
+        print('Failed to load:', ', '.join(failed))
+
+
+def get_worker_driver(worker_id: int):
+    """Chrome can not share a profile between instances, so every worker gets
+    its own copy of the logged in profile"""
+    user_data_dir = f'{user_data_directory}_workers/{worker_id}'
+    shutil.copytree(
+        user_data_directory,
+        user_data_dir,
+        symlinks=True,
+        ignore=shutil.ignore_patterns('Singleton*'),
+        dirs_exist_ok=True,
+    )
+    return get_driver(user_data_dir)
+
+
+def download_shipment_pages(
+    shipment_urls: list[str],
+    workers: int = DOWNLOAD_WORKERS,
+    retries: int = DOWNLOAD_RETRIES,
+    base_url: str = sbermarket_url,
+    directory: str = save_path_temp_files,
+    driver_factory: Callable = get_worker_driver,
+    resume: bool = True,
+    progress: Optional[Progress] = None,
+) -> list[str]:
+    """Downloads order pages with a pool of WebDriver instances pulling shipments
+    from a shared queue. Already saved pages are skipped when ``resume`` is set.
+    Returns shipments that could not be loaded after all retries.
+    """
+    shipments: Queue = Queue()
+    for shipment in get_pending_shipments(shipment_urls, directory, resume):
+        shipments.put(shipment)
+
+    failed: list[str] = []
+    threads = [
+        Thread(
+            target=download_worker,
+            args=(worker_id, shipments, failed, driver_factory, base_url, directory, retries, progress),
+        )
+        for worker_id in range(min(workers, shipments.qsize()))
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    while not shipments.empty():
+        failed.append(shipments.get_nowait())
+    return failed
+
+
+def get_pending_shipments(
+    shipment_urls: list[str], directory: str = save_path_temp_files, resume: bool = True
+) -> list[str]:
+    """shipments of ``shipment_urls`` whose pages still have to be downloaded"""
+    shipments = [shipment_url.split('/')[-1] for shipment_url in shipment_urls]
+    if not resume:
+        return shipments
+    return [shipment for shipment in shipments if not os.path.exists(f'{directory}/{shipment}.html')]
+
+
+def download_worker(
+    worker_id: int,
+    shipments: Queue,
+    failed: list[str],
+    driver_factory: Callable,
+    base_url: str,
+    directory: str,
+    retries: int,
+    progress: Optional[Progress] = None,
+):
+    """Downloads shipments from the queue until it is empty. Any error counts as
+    a failed attempt; a driver whose session died is replaced by a new one."""
+    driver = None
+    try:
+        while True:
+            try:
+                shipment = shipments.get_nowait()
+            except Empty:
+                return
+            for attempt in range(1, retries + 1):
+                try:
+                    if driver is None:
+                        driver = driver_factory(worker_id)
+                    save_shipment_page(driver, shipment, base_url, directory)
+                    break
+                except Exception as err:
+                    print(f'[worker {worker_id}] {shipment}: attempt {attempt} failed: {getattr(err, "msg", None) or err!r}')
+                    if driver is not None and not driver_is_alive(driver):
+                        print(f'[worker {worker_id}] driver session is lost, restarting')
+                        quit_driver(driver)
+                        driver = None
+            else:
+                failed.append(shipment)
+            if progress is not None:
+                progress.advance()
+    finally:
+        if driver is not None:
+            quit_driver(driver)
+
+
+def driver_is_alive(driver) -> bool:
+    try:
+        driver.execute_script('return 1')
+        return True
+    except Exception:
+        return False
+
+
+def quit_driver(driver):
+    try:
+        driver.quit()
+    except Exception:
+        pass
 
 
-def get_html_shipment():
+def save_shipment_page(driver, shipment: str, base_url: str, directory: str):
     shipment_load_more_button_class = 'styles_btnLoadMore__mTtLf'
-    original_window = driver.current_window_handle
+    print('Start loading', shipment)
+    driver.get(f'{base_url}/{shipment}')
+    (WebDriverWait(driver, 5, ignored_exceptions=StaleElementReferenceException)
+     .until(lambda driver: driver.execute_script('return document.readyState') == 'complete'))
+    scrolling_and_save_pages(
+        driver,
+        shipment_load_more_button_class,
+        file_name=shipment,
+        directory=directory,
+        items_selector='.styles_assemblyItemContent__o1cVR',
+    )
+    print(shipment, ' is uploaded')
 
-    with open(f'{save_path_temp_files}/shipment_urls.txt') as file:
-        for line in file:
-            shipment_url = line.rstrip()
-            shipment = shipment_url.split('/')[-1]
-            driver.switch_to.new_window('tab')
-            WebDriverWait(driver, 5).until(EC.number_of_windows_to_be(2))
-            print('Start loading', shipment)
-            driver.get(f'{sbermarket_url}/{shipment}')
-            (WebDriverWait(driver, 5, ignored_exceptions=StaleElementReferenceException)
-             .until(lambda driver: driver.execute_script('return document.readyState') == 'complete'))
-            scrolling_and_save_pages(shipment_load_more_button_class, file_name=shipment)
-            print(shipment, ' is uploaded')
-            driver.close()
-            driver.switch_to.window(original_window)
-
-
-def get_shipment_urls():
-    with open(f'{save_path_temp_files}/shipments.html') as file:
+
+def get_shipment_urls(
+    known_shipments: Optional[set[str]] = None, directory: str = save_path_temp_files
+) -> list[str]:
+    with open(f'{directory}/shipments.html') as file:
         src = file.read()
     soup = BeautifulSoup(src, 'lxml')
     shipments_a = soup.find('div', class_='styles_list___dvv1').find_all('a')
@@ -59,167 +227,128 @@ def get_shipment_urls():
 
     for shipment in shipments_a:
         shipment_url = shipment.get('href')
+        if known_shipments and shipment_url.rstrip('/').split('/')[-1] in known_shipments:
+            continue
         urls.append(shipment_url)
 
-    with open(f'{save_path_temp_files}/shipment_urls.txt', 'w') as file:
+    with open(f'{directory}/shipment_urls.txt', 'w') as file:
         for url in urls:
             file.write(f'{url}\n')
+    return urls
 
 
-def scrolling_and_save_pages(button_xpath: str, file_name: str):
-    try:
-        errors = [NoSuchElementException, StaleElementReferenceException]
-        while True:
-            loading_element = WebDriverWait(driver, 10, ignored_exceptions=errors).until(
-                EC.presence_of_element_located((By.CLASS_NAME, button_xpath))
-            )
-            if driver.find_elements(By.CLASS_NAME, button_xpath):
-                scroll_origin = ScrollOrigin.from_element(loading_element)
-                (
-                    ActionChains(driver)
-                    .scroll_from_origin(scroll_origin, 0, 100)
-                    .pause(2)
-                    .move_to_element(loading_element)
-                    .pause(1)
-                    .click()
-                    .pause(1)
-                    .perform()
-                )
-    except TimeoutException:
-        with open(f'{save_path_temp_files}/{file_name}.html', 'w') as shipments:
-            shipments.write(driver.page_source)
+def scrolling_and_save_pages(
+    driver,
+    button_xpath: str,
+    file_name: str,
+    directory: str = save_path_temp_files,
+    items_selector: Optional[str] = None,
+    timeout: float = LOAD_MORE_TIMEOUT,
+    should_stop: Optional[Callable[[], bool]] = None,
+):
+    """Clicks the "load more" button until it disappears or stops adding items.
 
+    After every click waits only until the number of ``items_selector`` elements
+    grows or the button is gone, instead of sleeping for a fixed time.
+    ``should_stop`` is checked before every click to finish loading early.
+    """
+    errors = [NoSuchElementException, StaleElementReferenceException]
+    waited = worked = 0.0
+    clicks = 0
 
-def get_data_from_shipment():
-    shipments_data = {}
-    dict_months = {
-        'янв': '01', 'февр': '02', 'марта': '03', 'апр': '04',
-        'мая': '05', 'июня': '06', 'июля': '07', 'авг': '08',
-        'сент': '09', 'окт': '10', 'нояб': '11', 'дек': '12',
-    }
-    prev_month_val = '00'
-    year = date.today().year
+    def count_items() -> int:
+        return len(driver.find_elements(By.CSS_SELECTOR, items_selector)) if items_selector else 0
 
-    with open(f'{save_path_temp_files}/shipment_urls.txt') as file:
-        shipments_list = [line.rstrip().split('/')[-1] for line in file]
-
-    for shipment in shipments_list:
-        with open(f'{save_path_temp_files}/{shipment}.html') as html:
-            src = html.read()
-        shipment_num = shipment
-        soup = BeautifulSoup(src, 'lxml')
-        item_divs = soup.findAll('div', class_='styles_assemblyItemContent__o1cVR')
-        shipments_data.update({shipment_num: {}})
-        try:
-            shipment_merchant = soup.find('div', class_='order-goods-list__good-merchant').get_text()
-        except Exception:
-            shipment_merchant = None
-        try:
-            shipment_status = soup.find('p', class_='NewShipmentState_stateCompleteName__rKoqH').get_text()
-        except Exception:
-            shipment_status = None
-        if shipment_status is None:
-            try:
-                shipment_status = soup.find('div', class_='NewShipmentState_stateCalcelText__XDxWj').get_text()
-            except Exception:
-                shipment_status = None
-        try:
-            sbermarket_date = soup.find('p', class_='NewShipmentState_time__uJGKF').get_text()
-            sbermarket_date = sbermarket_date.split(',')[0]
-            day = sbermarket_date.split(' ')[0]
-            month = dict_months.get(sbermarket_date.split(' ')[1])
-
-            if month == '12' and prev_month_val == '01':
-                year -= 1
-            prev_month_val = month
-            shipment_date = f'{str(year)}-{month}-{day}'
-        except Exception:
-            shipment_date = None
-        try:
-            shipping_address = soup.find('span', class_='styles_textLarge__Vs7i4').get_text()
-        except Exception:
-            shipping_address = None
-        try:
-            shipping_cost = soup.find(attrs={'data-qa': 'user-shipment-total', 'class': 'styles_detailsText__Pnv_4'}).get_text()
-            shipping_cost = float(shipping_cost[:-2].replace(',', '.').replace(u'\xa0', ''))
-        except Exception:
-            shipping_cost = None
-        try:
-            bonuses = soup.find(attrs={'data-qa': 'loyalty-accrual', 'class': 'styles_textSmall__haByG'}).get_text()
-            bonuses = int(bonuses)
-        except Exception:
-            bonuses = None
-        if bonuses is None:
-            try:
-                bonuses = soup.find(attrs={'class': '', 'data-qa': 'loyalty-accrual'}).get_text()
-                if '+' in bonuses:
-                    bonuses = 0
-                else:
-                    bonuses = int(bonuses)
-            except Exception:
-                bonuses = 0
+    started = time.perf_counter()
+    try:
+        WebDriverWait(driver, timeout, poll_frequency=0.1, ignored_exceptions=errors).until(
+            lambda driver: driver.find_elements(By.CLASS_NAME, button_xpath) or count_items()
+        )
+    except TimeoutException:
+        pass
+    waited += time.perf_counter() - started
+
+    while True:
+        started = time.perf_counter()
+        buttons = driver.find_elements(By.CLASS_NAME, button_xpath)
+        if not buttons or (should_stop is not None and should_stop()):
+            worked += time.perf_counter() - started
+            break
+        items_before = count_items()
         try:
-            assembly_and_delivery = soup.find(attrs={'data-qa': 'user-shipment-cost', 'class': 'styles_total__9uFoP'}).get_text()
-            assembly_and_delivery = 0 if assembly_and_delivery == 'бесплатно' else int(assembly_and_delivery)
-        except Exception:
-            assembly_and_delivery = 0
+            ActionChains(driver).scroll_to_element(buttons[0]).move_to_element(buttons[0]).click().perform()
+        except StaleElementReferenceException:
+            continue
+        finally:
+            worked += time.perf_counter() - started
+        clicks += 1
+
+        started = time.perf_counter()
         try:
-            discount = soup.find(attrs={'data-qa': 'user-shipment-product-discount', 'class': 'styles_textPromo__StcD0'}).get_text()
-            discount = abs(float(discount[:-2].replace(',', '.').replace(u'\xa0', '')))
-        except Exception:
-            discount = 0
-
-        shipments_data[shipment_num].update(shipment_merchant=shipment_merchant)
-        shipments_data[shipment_num].update(shipment_status=shipment_status)
-        shipments_data[shipment_num].update(shipment_date=shipment_date)
-        shipments_data[shipment_num].update(shipping_address=shipping_address)
-        shipments_data[shipment_num].update(shipping_cost=shipping_cost)
-        shipments_data[shipment_num].update(bonuses=bonuses)
-        shipments_data[shipment_num].update(assembly_and_delivery=assembly_and_delivery)
-        shipments_data[shipment_num].update(discount=discount)
-
-        products = {}
-        product_id_by_shipment = 1
-        for div in item_divs:
-            try:
-                product_name = div.find('div', class_='styles_name__V0VHp').get_text()
-            except Exception:
-                product_name = None
-            try:
-                quantity = div.find('div', class_='styles_quantity__JZCXN').get_text()
-            except Exception:
-                quantity = None
-            try:
-                purchase_price = div.find('div', class_='styles_currentPrice__Z3Whh').get_text()
-                purchase_price = float(purchase_price[:-2].replace(',', '.').replace(u'\xa0', ''))
-            except Exception:
-                purchase_price = None
-            try:
-                purchase_status = div.find('div', class_='StatusBadge_md__U4hG8').get_text()
-            except Exception:
-                purchase_status = None
+            WebDriverWait(driver, timeout, poll_frequency=0.1, ignored_exceptions=errors).until(
+                lambda driver: (
+                    not driver.find_elements(By.CLASS_NAME, button_xpath)
+                    or (items_selector is not None and count_items() > items_before)
+                )
+            )
+        except TimeoutException:
+            break
+        finally:
+            waited += time.perf_counter() - started
+
+    started = time.perf_counter()
+    # written under a temporary name so that an interrupted run never leaves
+    # a partial page behind for resume to skip
+    with open(f'{directory}/{file_name}.html.part', 'w') as shipments:
+        shipments.write(driver.page_source)
+    os.replace(f'{directory}/{file_name}.html.part', f'{directory}/{file_name}.html')
+    worked += time.perf_counter() - started
+    print(f'{file_name}: {clicks} clicks, waiting {waited:.1f}s, working {worked:.1f}s')
 
-            products.update({product_id_by_shipment: {}})
-            products[product_id_by_shipment].update(product_name=product_name)
-            products[product_id_by_shipment].update(quantity=quantity)
-            products[product_id_by_shipment].update(purchase_price=purchase_price)
-            products[product_id_by_shipment].update(purchase_status=purchase_status)
 
-            product_id_by_shipment += 1
+def read_shipment_list(directory: str = save_path_temp_files) -> list[str]:
+    with open(f'{directory}/shipment_urls.txt') as file:
+        return [line.rstrip().split('/')[-1] for line in file if line.strip()]
 
-        shipments_data[shipment_num].update(products=products)
 
-    with open(f'{save_path_temp_files}/{temp_json_shipments}.json', 'w') as file:
-        json.dump(shipments_data, file, indent=4)
+def get_data_from_shipment(
+    workers: int = PARSER_WORKERS,
+    engine: str = EXTRACTION_ENGINE,
+    directory: str = save_path_temp_files,
+    output_path: Optional[str] = f'{save_path_temp_files}/{temp_json_shipments}.ndjson',
+    progress: Optional[Progress] = None,
+    use_cache: bool = EXTRACTION_CACHE,
+) -> ExtractionStats:
+    """extracts saved order pages into NDJSON, nothing is written when ``output_path`` is None;
+    pages extracted by a previous run are taken from the extraction cache of the directory.
+    Returns the selector stats of the run"""
+    shipments_list = read_shipment_list(directory)
+    stats = ExtractionStats()
+    with ExitStack() as stack:
+        output = stack.enter_context(open(output_path, 'w')) if output_path is not None else None
+        cache = stack.enter_context(ExtractionCache(f'{directory}/extraction_cache.sqlite3')) if use_cache else None
+        for shipment_data in extract_shipments(shipments_list, directory, workers, engine, stats, cache):
+            if output is not None:
+                output.write(json.dumps(shipment_data, ensure_ascii=False) + '\n')
+            if progress is not None:
+                progress.advance()
+        if cache is not None:
+            print(cache.report())
+    broken_fields = stats.broken_fields()
+    if broken_fields:
+        print('Check the selectors of:', ', '.join(f'{name} ({stats.status(name)})' for name in broken_fields))
+    return stats
 
 
 def main():
     # if os.path.isdir(save_path_temp_files):
     #     shutil.rmtree(save_path_temp_files)
     # os.mkdir(save_path_temp_files)
+    driver = get_driver()
     try:
-        # get_html_shipments()
-        # get_shipment_urls()
+        # known_shipments = get_known_shipments()
+        # get_html_shipments(driver, known_shipments)
+        # get_shipment_urls(known_shipments)
         # get_html_shipment()
         get_data_from_shipment()
     except Exception as ex:
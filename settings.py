@@ -1,6 +1,8 @@
 from __future__ import annotations
 
+import os
 import pathlib
+from typing import Optional
 
 from envparse import Env
 from selenium import webdriver
@@ -8,13 +10,13 @@ from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.chrome.service import Service
 
 
-def get_driver() -> webdriver:
+def get_driver(user_data_dir: Optional[str] = None) -> webdriver:
     user_agent = 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/48.0.2564.116 Safari/537.36'
     options = Options()
     options.add_argument('--no-sandbox')
     options.add_argument('--allow-profiles-outside-user-dir')
     options.add_argument('--enable-profile-shortcut-manager')
-    options.add_argument(f'user-data-dir={script_directory}/userdata')
+    options.add_argument(f'user-data-dir={user_data_dir or user_data_directory}')
     options.add_argument('--profile-directory=Profile 1')
     options.add_argument(f'--user-agent={user_agent}')
     serv = Service(executable_path='/home/alexandr/food_expenses/chromedriver')
@@ -22,6 +24,7 @@ def get_driver() -> webdriver:
 
 
 script_directory = pathlib.Path().absolute()
+user_data_directory: str = f'{script_directory}/userdata'
 save_path_temp_files: str = f'{script_directory}/tempdata'
 temp_json_shipments : str = 'json_shipments'
 sbermarket_url: str = 'https://sbermarket.ru/user/shipments'
@@ -35,3 +38,37 @@ DB_NAME: str = env.str('DB_NAME')
 DB_USER: str = env.str('DB_USER')
 DB_PASS: str = env.str('DB_PASS')
 DATABASE_URL: str = f'postgresql+asyncpg://{DB_USER}:{DB_PASS}@{DB_HOST}:{DB_PORT}/{DB_NAME}'
+
+# database_test service of docker-compose-local.yaml, used by the benchmarks
+TEST_DB_HOST: str = env.str('TEST_DB_HOST', default='localhost')
+TEST_DB_PORT: str = env.str('TEST_DB_PORT', default='5433')
+TEST_DB_NAME: str = env.str('TEST_DB_NAME', default='FoodExpensesTest')
+TEST_DB_USER: str = env.str('TEST_DB_USER', default='postgrestest')
+TEST_DB_PASS: str = env.str('TEST_DB_PASS', default='postgrestest')
+TEST_DATABASE_URL: str = (
+    f'postgresql+asyncpg://{TEST_DB_USER}:{TEST_DB_PASS}@{TEST_DB_HOST}:{TEST_DB_PORT}/{TEST_DB_NAME}'
+)
+
+DB_POOL_SIZE: int = env.int('DB_POOL_SIZE', default=5)
+DB_MAX_OVERFLOW: int = env.int('DB_MAX_OVERFLOW', default=10)
+DB_POOL_TIMEOUT: int = env.int('DB_POOL_TIMEOUT', default=30)
+DB_POOL_RECYCLE: int = env.int('DB_POOL_RECYCLE', default=1800)
+DB_POOL_PRE_PING: bool = env.bool('DB_POOL_PRE_PING', default=True)
+DB_ECHO: bool = env.bool('DB_ECHO', default=False)
+LOG_LEVEL: str = env.str('LOG_LEVEL', default='INFO')
+SLOW_QUERY_THRESHOLD: float = env.float('SLOW_QUERY_THRESHOLD', default=0.5)
+QUERY_LOG_SAMPLE_RATE: float = env.float('QUERY_LOG_SAMPLE_RATE', default=0.0)
+SERVER_TIMING: bool = env.bool('SERVER_TIMING', default=False)
+IMPORT_BATCH_SIZE: int = env.int('IMPORT_BATCH_SIZE', default=500)
+PARSER_WORKERS: int = env.int('PARSER_WORKERS', default=os.cpu_count() or 1)
+EXTRACTION_ENGINE: str = env.str('EXTRACTION_ENGINE', default='lxml')
+EXTRACTION_CACHE: bool = env.bool('EXTRACTION_CACHE', default=True)
+DOWNLOAD_WORKERS: int = env.int('DOWNLOAD_WORKERS', default=4)
+DOWNLOAD_RETRIES: int = env.int('DOWNLOAD_RETRIES', default=3)
+LOAD_MORE_TIMEOUT: float = env.float('LOAD_MORE_TIMEOUT', default=5.0)
+INCREMENTAL_SCRAPING: bool = env.bool('INCREMENTAL_SCRAPING', default=False)
+REPORT_CACHE_TTL: float = env.float('REPORT_CACHE_TTL', default=30.0)
+REPORT_CACHE_SIZE: int = env.int('REPORT_CACHE_SIZE', default=256)
+SHIPMENT_PAGE_SIZE: int = env.int('SHIPMENT_PAGE_SIZE', default=50)
+SHIPMENT_PAGE_SIZE_MAX: int = env.int('SHIPMENT_PAGE_SIZE_MAX', default=500)
+EXPORT_CHUNK_SIZE: int = env.int('EXPORT_CHUNK_SIZE', default=5000)
@@ -0,0 +1,600 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import pathlib
+import re
+import sqlite3
+import time
+from abc import ABC
+from abc import abstractmethod
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack
+from datetime import date
+from typing import Iterable
+from typing import Iterator
+from typing import Optional
+
+import lxml.html
+from bs4 import BeautifulSoup
+from lxml import etree
+
+
+# records cached by ExtractionCache are invalidated by any change of this module
+EXTRACTOR_VERSION = hashlib.sha256(pathlib.Path(__file__).read_bytes()).hexdigest()[:16]
+
+DICT_MONTHS = {
+    'янв': '01', 'февр': '02', 'марта': '03', 'апр': '04',
+    'мая': '05', 'июня': '06', 'июля': '07', 'авг': '08',
+    'сент': '09', 'окт': '10', 'нояб': '11', 'дек': '12',
+}
+
+
+class ShipmentDateResolver:
+    """Restores the year of shipment dates.
+
+    Order pages show only day and month, so the year is derived from the order
+    of shipments in the list (newest first): it decreases when December follows
+    January. Shipments must therefore be resolved in list order.
+    """
+
+    def __init__(self, year: Optional[int] = None):
+        self.year = year or date.today().year
+        self.prev_month_val = '00'
+
+    def resolve(self, date_parts: Optional[Iterable]) -> Optional[str]:
+        if date_parts is None:
+            return None
+        day, month = date_parts
+        if month == '12' and self.prev_month_val == '01':
+            self.year -= 1
+        self.prev_month_val = month
+        return f'{str(self.year)}-{month}-{day}'
+
+
+class Selector:
+    """Element lookup by tag and attributes, with BeautifulSoup ``find`` semantics
+    for the ``class`` attribute, compiled to an XPath expression once.
+
+    ``class_prefix`` matches a class by its name without the CSS modules hash,
+    e.g. ``styles_name__`` for ``styles_name__V0VHp``.
+    """
+
+    def __init__(self, tag: Optional[str], attrs: dict, class_prefix: Optional[str] = None):
+        self.tag = tag
+        self.attrs = attrs
+        self.class_prefix = class_prefix
+        self.soup_attrs = dict(attrs)
+        if class_prefix is not None:
+            self.soup_attrs['class'] = re.compile(f'^{re.escape(class_prefix)}')
+        self.xpath = etree.XPath(self._build_xpath())
+
+    def _build_xpath(self) -> str:
+        conditions = []
+        for name, value in self.attrs.items():
+            if name == 'class' and not value:
+                conditions.append('not(normalize-space(@class))')
+            elif name == 'class':
+                conditions.append(f"contains(concat(' ', normalize-space(@class), ' '), ' {value} ')")
+            else:
+                conditions.append(f"@{name}='{value}'")
+        if self.class_prefix is not None:
+            conditions.append(f"contains(concat(' ', normalize-space(@class)), ' {self.class_prefix}')")
+        predicate = f"[{' and '.join(conditions)}]" if conditions else ''
+        return f'.//{self.tag or "*"}{predicate}'
+
+
+class Field:
+    """Selectors of one extracted field: the primary one and fallbacks which are
+    tried in order when it finds nothing. Misses of ``optional`` fields are
+    expected, e.g. there is no discount line on orders without a discount."""
+
+    def __init__(self, primary: Selector, *fallbacks: Selector, optional: bool = False):
+        self.selectors = (primary, *fallbacks)
+        self.optional = optional
+
+
+SHIPMENT_FIELDS = {
+    'items': Field(
+        Selector('div', {'class': 'styles_assemblyItemContent__o1cVR'}),
+        Selector('div', {}, class_prefix='styles_assemblyItemContent__'),
+    ),
+    'shipment_merchant': Field(Selector('div', {'class': 'order-goods-list__good-merchant'})),
+    'shipment_status': Field(
+        Selector('p', {'class': 'NewShipmentState_stateCompleteName__rKoqH'}),
+        Selector('p', {}, class_prefix='NewShipmentState_stateCompleteName__'),
+        optional=True,
+    ),
+    'shipment_status_cancelled': Field(
+        Selector('div', {'class': 'NewShipmentState_stateCalcelText__XDxWj'}),
+        Selector('div', {}, class_prefix='NewShipmentState_stateCalcelText__'),
+        optional=True,
+    ),
+    'shipment_time': Field(
+        Selector('p', {'class': 'NewShipmentState_time__uJGKF'}),
+        Selector('p', {}, class_prefix='NewShipmentState_time__'),
+    ),
+    'shipping_address': Field(
+        Selector('span', {'class': 'styles_textLarge__Vs7i4'}),
+        Selector('span', {}, class_prefix='styles_textLarge__'),
+    ),
+    'shipping_cost': Field(
+        Selector(None, {'data-qa': 'user-shipment-total', 'class': 'styles_detailsText__Pnv_4'}),
+        Selector(None, {'data-qa': 'user-shipment-total'}, class_prefix='styles_detailsText__'),
+    ),
+    'bonuses': Field(
+        Selector(None, {'data-qa': 'loyalty-accrual', 'class': 'styles_textSmall__haByG'}),
+        Selector(None, {'data-qa': 'loyalty-accrual'}, class_prefix='styles_textSmall__'),
+        optional=True,
+    ),
+    'bonuses_without_class': Field(Selector(None, {'class': '', 'data-qa': 'loyalty-accrual'}), optional=True),
+    'assembly_and_delivery': Field(
+        Selector(None, {'data-qa': 'user-shipment-cost', 'class': 'styles_total__9uFoP'}),
+        Selector(None, {'data-qa': 'user-shipment-cost'}, class_prefix='styles_total__'),
+    ),
+    'discount': Field(
+        Selector(None, {'data-qa': 'user-shipment-product-discount', 'class': 'styles_textPromo__StcD0'}),
+        Selector(None, {'data-qa': 'user-shipment-product-discount'}, class_prefix='styles_textPromo__'),
+        optional=True,
+    ),
+}
+PRODUCT_FIELDS = {
+    'product_name': Field(
+        Selector('div', {'class': 'styles_name__V0VHp'}),
+        Selector('div', {}, class_prefix='styles_name__'),
+    ),
+    'quantity': Field(
+        Selector('div', {'class': 'styles_quantity__JZCXN'}),
+        Selector('div', {}, class_prefix='styles_quantity__'),
+    ),
+    'purchase_price': Field(
+        Selector('div', {'class': 'styles_currentPrice__Z3Whh'}),
+        Selector('div', {}, class_prefix='styles_currentPrice__'),
+    ),
+    'purchase_status': Field(
+        Selector('div', {'class': 'StatusBadge_md__U4hG8'}),
+        Selector('div', {}, class_prefix='StatusBadge_md__'),
+    ),
+}
+FIELDS = {**SHIPMENT_FIELDS, **PRODUCT_FIELDS}
+
+
+class FieldStats:
+    def __init__(self):
+        self.hits = 0
+        self.fallbacks = 0
+        self.misses = 0
+        self.seconds = 0.0
+
+    @property
+    def lookups(self) -> int:
+        return self.hits + self.fallbacks + self.misses
+
+
+class ExtractionStats:
+    """Per field lookup counters and timing: ``hits`` are found by the primary
+    selector, ``fallbacks`` by one of the fallback selectors, ``misses`` by none.
+    Stats of pool workers are merged into the parent's instance. Pages taken
+    from the extraction cache are counted in ``cached_pages`` too and bring the
+    stats of their first extraction."""
+
+    def __init__(self):
+        self.pages = 0
+        self.cached_pages = 0
+        self.parse_seconds = 0.0
+        self.fields = {name: FieldStats() for name in FIELDS}
+
+    def observe(self, name: str, selector_index: Optional[int], seconds: float) -> None:
+        stats = self.fields[name]
+        if selector_index is None:
+            stats.misses += 1
+        elif selector_index == 0:
+            stats.hits += 1
+        else:
+            stats.fallbacks += 1
+        stats.seconds += seconds
+
+    def merge(self, other: ExtractionStats) -> None:
+        self.pages += other.pages
+        self.cached_pages += other.cached_pages
+        self.parse_seconds += other.parse_seconds
+        for name, other_stats in other.fields.items():
+            stats = self.fields[name]
+            stats.hits += other_stats.hits
+            stats.fallbacks += other_stats.fallbacks
+            stats.misses += other_stats.misses
+            stats.seconds += other_stats.seconds
+
+    def to_dict(self) -> dict:
+        return {
+            'pages': self.pages,
+            'parse_seconds': self.parse_seconds,
+            'fields': {
+                name: [stats.hits, stats.fallbacks, stats.misses, stats.seconds]
+                for name, stats in self.fields.items()
+            },
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> ExtractionStats:
+        extraction_stats = cls()
+        extraction_stats.pages = data['pages']
+        extraction_stats.parse_seconds = data['parse_seconds']
+        for name, (hits, fallbacks, misses, seconds) in data['fields'].items():
+            stats = extraction_stats.fields[name]
+            stats.hits, stats.fallbacks, stats.misses, stats.seconds = hits, fallbacks, misses, seconds
+        return extraction_stats
+
+    def status(self, name: str) -> str:
+        stats = self.fields[name]
+        if not stats.lookups:
+            return ''
+        if not FIELDS[name].optional and stats.misses == stats.lookups:
+            return 'broken'
+        if not FIELDS[name].optional and stats.misses:
+            return f'partially broken, {stats.misses / stats.lookups:.0%} missed'
+        if stats.fallbacks and not stats.hits:
+            return 'primary selector broken'
+        if stats.fallbacks:
+            return 'primary selector degraded'
+        return ''
+
+    def broken_fields(self) -> list[str]:
+        """required fields missed on some pages and fields whose primary selector
+        stopped matching, with or without a working fallback"""
+        return [name for name in self.fields if self.status(name)]
+
+    def report(self) -> str:
+        cached = f' ({self.cached_pages} from the extraction cache)' if self.cached_pages else ''
+        lines = [
+            f'pages={self.pages}{cached} parse={self.parse_seconds / max(self.pages, 1) * 1e6:.1f}us/page',
+            f'{"field":<26} {"hits":>8} {"fallbacks":>10} {"misses":>8} {"us/page":>9}  status',
+        ]
+        for name, stats in self.fields.items():
+            lines.append(
+                f'{name:<26} {stats.hits:>8} {stats.fallbacks:>10} {stats.misses:>8} '
+                f'{stats.seconds / max(self.pages, 1) * 1e6:>9.1f}  {self.status(name)}'
+            )
+        return '\n'.join(lines)
+
+
+class Page(ABC):
+    """Looks fields up trying their selectors in order and records the outcome
+    in ``stats``. Without stats nothing is timed or counted."""
+
+    def __init__(self, stats: Optional[ExtractionStats] = None):
+        self.stats = stats
+
+    @abstractmethod
+    def select(self, node, selector: Selector) -> list:
+        ...
+
+    @abstractmethod
+    def select_text(self, node, selector: Selector) -> Optional[str]:
+        ...
+
+    def find_all(self, node, name: str) -> list:
+        started = time.perf_counter() if self.stats is not None else 0.0
+        for index, selector in enumerate(FIELDS[name].selectors):
+            elements = self.select(node, selector)
+            if elements:
+                self._observe(name, index, started)
+                return elements
+        self._observe(name, None, started)
+        return []
+
+    def text(self, node, name: str) -> Optional[str]:
+        started = time.perf_counter() if self.stats is not None else 0.0
+        for index, selector in enumerate(FIELDS[name].selectors):
+            text = self.select_text(node, selector)
+            if text is not None:
+                self._observe(name, index, started)
+                return text
+        self._observe(name, None, started)
+        return None
+
+    def _observe(self, name: str, selector_index: Optional[int], started: float) -> None:
+        if self.stats is not None:
+            self.stats.observe(name, selector_index, time.perf_counter() - started)
+
+
+class SoupPage(Page):
+    """Full BeautifulSoup tree, the reference implementation"""
+
+    def __init__(self, src: str, stats: Optional[ExtractionStats] = None):
+        super().__init__(stats)
+        started = time.perf_counter()
+        self.root = BeautifulSoup(src, 'lxml')
+        if stats is not None:
+            stats.parse_seconds += time.perf_counter() - started
+
+    def select(self, node, selector: Selector) -> list:
+        return node.find_all(selector.tag, attrs=selector.soup_attrs)
+
+    def select_text(self, node, selector: Selector) -> Optional[str]:
+        element = node.find(selector.tag, attrs=selector.soup_attrs)
+        return element.get_text() if element is not None else None
+
+
+class LxmlPage(Page):
+    """lxml tree queried with the precompiled XPath expressions"""
+
+    def __init__(self, src: str, stats: Optional[ExtractionStats] = None):
+        super().__init__(stats)
+        started = time.perf_counter()
+        self.root = lxml.html.document_fromstring(src)
+        if stats is not None:
+            stats.parse_seconds += time.perf_counter() - started
+
+    def select(self, node, selector: Selector) -> list:
+        return selector.xpath(node)
+
+    def select_text(self, node, selector: Selector) -> Optional[str]:
+        elements = selector.xpath(node)
+        return str(elements[0].text_content()) if elements else None
+
+
+ENGINES = {'bs4': SoupPage, 'lxml': LxmlPage}
+
+
+def parse_price(price: str) -> float:
+    return float(price[:-2].replace(',', '.').replace(u'\xa0', ''))
+
+
+def extract_shipment(
+    shipment_num: str, src: str, engine: str = 'lxml', stats: Optional[ExtractionStats] = None
+) -> dict:
+    """Extracts shipment data from an order page.
+
+    Falls back to the BeautifulSoup engine if the requested one fails on the page.
+    The shipment date is left unresolved: ``shipment_date_parts`` holds the
+    (day, month) pair which ShipmentDateResolver turns into ``shipment_date``.
+    Field lookups are added to ``stats``.
+    """
+    page_stats = ExtractionStats() if stats is not None else None
+    try:
+        record = extract_page(shipment_num, ENGINES[engine](src, page_stats))
+    except Exception:
+        if engine == 'bs4':
+            raise
+        page_stats = ExtractionStats() if stats is not None else None
+        record = extract_page(shipment_num, SoupPage(src, page_stats))
+    if stats is not None:
+        page_stats.pages = 1
+        stats.merge(page_stats)
+    return record
+
+
+def extract_page(shipment_num: str, page: Page) -> dict:
+    root = page.root
+    item_divs = page.find_all(root, 'items')
+    shipment_merchant = page.text(root, 'shipment_merchant')
+    shipment_status = page.text(root, 'shipment_status')
+    if shipment_status is None:
+        shipment_status = page.text(root, 'shipment_status_cancelled')
+    try:
+        sbermarket_date = page.text(root, 'shipment_time')
+        sbermarket_date = sbermarket_date.split(',')[0]
+        day = sbermarket_date.split(' ')[0]
+        month = DICT_MONTHS.get(sbermarket_date.split(' ')[1])
+        shipment_date_parts = (day, month)
+    except Exception:
+        shipment_date_parts = None
+    shipping_address = page.text(root, 'shipping_address')
+    try:
+        shipping_cost = parse_price(page.text(root, 'shipping_cost'))
+    except Exception:
+        shipping_cost = None
+    try:
+        bonuses = int(page.text(root, 'bonuses'))
+    except Exception:
+        bonuses = None
+    if bonuses is None:
+        try:
+            bonuses = page.text(root, 'bonuses_without_class')
+            if '+' in bonuses:
+                bonuses = 0
+            else:
+                bonuses = int(bonuses)
+        except Exception:
+            bonuses = 0
+    try:
+        assembly_and_delivery = page.text(root, 'assembly_and_delivery')
+        assembly_and_delivery = 0 if assembly_and_delivery == 'бесплатно' else int(assembly_and_delivery)
+    except Exception:
+        assembly_and_delivery = 0
+    try:
+        discount = abs(parse_price(page.text(root, 'discount')))
+    except Exception:
+        discount = 0
+
+    products = {}
+    product_id_by_shipment = 1
+    for div in item_divs:
+        try:
+            purchase_price = parse_price(page.text(div, 'purchase_price'))
+        except Exception:
+            purchase_price = None
+
+        products[product_id_by_shipment] = {
+            'product_name': page.text(div, 'product_name'),
+            'quantity': page.text(div, 'quantity'),
+            'purchase_price': purchase_price,
+            'purchase_status': page.text(div, 'purchase_status'),
+        }
+        product_id_by_shipment += 1
+
+    return {
+        'shipment_num': shipment_num,
+        'shipment_merchant': shipment_merchant,
+        'shipment_status': shipment_status,
+        'shipment_date': None,
+        'shipment_date_parts': shipment_date_parts,
+        'shipping_address': shipping_address,
+        'shipping_cost': shipping_cost,
+        'bonuses': bonuses,
+        'assembly_and_delivery': assembly_and_delivery,
+        'discount': discount,
+        'products': products,
+    }
+
+
+def extract_shipment_file(shipment_num: str, directory: str, engine: str = 'lxml') -> dict:
+    with open(f'{directory}/{shipment_num}.html') as html:
+        src = html.read()
+    return extract_shipment(shipment_num, src, engine)
+
+
+def extract_shipment_file_with_stats(
+    shipment_num: str, directory: str, engine: str = 'lxml'
+) -> tuple[dict, ExtractionStats]:
+    """runs in pool workers, the page stats travel back to the parent with the record"""
+    stats = ExtractionStats()
+    with open(f'{directory}/{shipment_num}.html') as html:
+        src = html.read()
+    return extract_shipment(shipment_num, src, engine, stats), stats
+
+
+class ExtractionCache:
+    """Extracted records of order pages stored in SQLite.
+
+    A record is reused while the sha256 of its page, the engine and
+    EXTRACTOR_VERSION are unchanged; records of other extractor versions are
+    dropped on open. The page stats are stored with the record, so selector
+    reports of warm runs cover every page. The records are stored before date
+    resolution, which depends on the page order.
+    """
+
+    schema_version = 2
+
+    def __init__(self, path: str, version: str = EXTRACTOR_VERSION, commit_every: int = 1000):
+        self.connection = sqlite3.connect(path)
+        self.version = version
+        self.commit_every = commit_every
+        self.uncommitted = 0
+        self.hits = 0
+        self.misses = 0
+        (schema_version,) = self.connection.execute('PRAGMA user_version').fetchone()
+        if schema_version != self.schema_version:
+            self.connection.execute('DROP TABLE IF EXISTS extracted_pages')
+            self.connection.execute(f'PRAGMA user_version = {self.schema_version}')
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS extracted_pages ('
+            'shipment_num TEXT NOT NULL, engine TEXT NOT NULL, content_hash TEXT NOT NULL, '
+            'extractor_version TEXT NOT NULL, record TEXT NOT NULL, stats TEXT NOT NULL, '
+            'PRIMARY KEY (shipment_num, engine))'
+        )
+        self.connection.execute('DELETE FROM extracted_pages WHERE extractor_version != ?', (version,))
+        self.connection.commit()
+
+    def __enter__(self) -> ExtractionCache:
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @staticmethod
+    def content_hash(path: str) -> str:
+        with open(path, 'rb') as page:
+            return hashlib.sha256(page.read()).hexdigest()
+
+    def lookup(self, content_hashes: dict[str, str], engine: str) -> set[str]:
+        """shipments whose stored record was extracted by the engine from the same page content"""
+        stored = dict(self.connection.execute(
+            'SELECT shipment_num, content_hash FROM extracted_pages WHERE engine = ?', (engine,)
+        ))
+        found = {shipment for shipment, content_hash in content_hashes.items() if stored.get(shipment) == content_hash}
+        self.hits += len(found)
+        self.misses += len(content_hashes) - len(found)
+        return found
+
+    def get(self, shipment_num: str, engine: str) -> tuple[dict, ExtractionStats]:
+        record, stats = self.connection.execute(
+            'SELECT record, stats FROM extracted_pages WHERE shipment_num = ? AND engine = ?', (shipment_num, engine)
+        ).fetchone()
+        record = json.loads(record)
+        record['products'] = {int(product_id): product for product_id, product in record['products'].items()}
+        if record['shipment_date_parts'] is not None:
+            record['shipment_date_parts'] = tuple(record['shipment_date_parts'])
+        return record, ExtractionStats.from_dict(json.loads(stats))
+
+    def put(self, shipment_num: str, engine: str, content_hash: str, record: dict, stats: ExtractionStats) -> None:
+        self.connection.execute(
+            'INSERT OR REPLACE INTO extracted_pages VALUES (?, ?, ?, ?, ?, ?)',
+            (
+                shipment_num,
+                engine,
+                content_hash,
+                self.version,
+                json.dumps(record, ensure_ascii=False),
+                json.dumps(stats.to_dict()),
+            ),
+        )
+        self.uncommitted += 1
+        if self.uncommitted >= self.commit_every:
+            self.commit()
+
+    def commit(self) -> None:
+        self.connection.commit()
+        self.uncommitted = 0
+
+    def close(self) -> None:
+        self.commit()
+        self.connection.close()
+
+    def report(self) -> str:
+        lookups = self.hits + self.misses
+        hit_rate = self.hits / lookups if lookups else 0.0
+        return f'extraction cache: hits={self.hits} misses={self.misses} hit rate={hit_rate:.1%}'
+
+
+def extract_shipments(
+    shipments: list[str],
+    directory: str,
+    workers: int = 1,
+    engine: str = 'lxml',
+    stats: Optional[ExtractionStats] = None,
+    cache: Optional[ExtractionCache] = None,
+) -> Iterator[dict]:
+    """Extracts saved order pages, yielding records in the order of ``shipments``
+    with resolved shipment dates. Field lookups of all workers are added to ``stats``.
+    Pages found in ``cache`` are not extracted again, only the others go to the workers;
+    their stored stats are added to ``stats`` instead.
+    """
+    resolver = ShipmentDateResolver()
+    content_hashes = {}
+    cached = set()
+    if cache is not None:
+        content_hashes = {
+            shipment: cache.content_hash(f'{directory}/{shipment}.html') for shipment in shipments
+        }
+        cached = cache.lookup(content_hashes, engine)
+    pending = [shipment for shipment in shipments if shipment not in cached]
+    directories = [directory] * len(pending)
+    engines = [engine] * len(pending)
+    # the cache keeps the page stats with the record
+    collect_stats = stats is not None or cache is not None
+    extract = extract_shipment_file_with_stats if collect_stats else extract_shipment_file
+    with ExitStack() as stack:
+        if workers > 1 and pending:
+            executor = stack.enter_context(ProcessPoolExecutor(max_workers=workers))
+            chunksize = max(1, len(pending) // (workers * 4))
+            results = executor.map(extract, pending, directories, engines, chunksize=chunksize)
+        else:
+            results = map(extract, pending, directories, engines)
+        if cache is not None:
+            stack.callback(cache.commit)
+        for shipment in shipments:
+            if shipment in cached:
+                record, page_stats = cache.get(shipment, engine)
+                page_stats.cached_pages = page_stats.pages
+            else:
+                record = next(results)
+                if collect_stats:
+                    record, page_stats = record
+                if cache is not None:
+                    cache.put(shipment, engine, content_hashes[shipment], record, page_stats)
+            if stats is not None:
+                stats.merge(page_stats)
+            record['shipment_date'] = resolver.resolve(record.pop('shipment_date_parts'))
+            yield record
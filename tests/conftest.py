@@ -0,0 +1,14 @@
+from __future__ import annotations
+
+import os
+
+# settings requires the database connection, point it to the test database so
+# that modules importing settings load without an .env file
+for name, value in (
+    ('DB_HOST', 'localhost'),
+    ('DB_PORT', '5433'),
+    ('DB_NAME', 'FoodExpensesTest'),
+    ('DB_USER', 'postgrestest'),
+    ('DB_PASS', 'postgrestest'),
+):
+    os.environ.setdefault(name, value)
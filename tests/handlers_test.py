@@ -0,0 +1,43 @@
+from __future__ import annotations
+
+import datetime
+
+import pytest
+from fastapi.testclient import TestClient
+
+from api.actions import ReportRepository
+from api.schemas import ReportResponse
+from database.session import get_async_session
+from main import app
+
+
+async def no_session():
+    yield None
+
+
+@pytest.fixture
+def client():
+    app.dependency_overrides[get_async_session] = no_session
+    yield TestClient(app)
+    app.dependency_overrides.clear()
+
+
+@pytest.mark.parametrize('path', ['/report/', '/report/breakdown'])
+@pytest.mark.parametrize('date_from', ['2023-02-30', '2023-13-01', '2023-01-01x', '01.01.2023'])
+def test_report_rejects_invalid_dates(client, path, date_from):
+    response = client.get(path, params={'date_from': date_from, 'date_to': '2023-12-31'})
+    assert response.status_code == 422
+    assert response.json()['detail'][0]['loc'] == ['query', 'date_from']
+
+
+def test_report_passes_parsed_dates(client, monkeypatch):
+    requests = []
+
+    async def get_spending_report(body, session):
+        requests.append(body)
+        return ReportResponse(report='ok')
+
+    monkeypatch.setattr(ReportRepository, '_get_spending_report', get_spending_report)
+    response = client.get('/report/', params={'date_from': '2023-02-28', 'date_to': '2023-03-01'})
+    assert response.status_code == 200
+    assert (requests[0].date_from, requests[0].date_to) == (datetime.date(2023, 2, 28), datetime.date(2023, 3, 1))
@@ -0,0 +1,134 @@
+from __future__ import annotations
+
+import os
+
+import pytest
+from selenium.common import InvalidSessionIdException
+from selenium.common import TimeoutException
+from selenium.common import WebDriverException
+from selenium.webdriver.common.by import By
+
+import sbermarket_parser
+from sbermarket_parser import download_shipment_pages
+from sbermarket_parser import get_pending_shipments
+
+BASE_URL = 'http://orders.test/user/shipments'
+
+
+class StubDriver:
+    """Serves a one-screen order page without a "load more" button. ``failures``
+    maps a shipment to the errors its next loads raise, an InvalidSessionIdException
+    also kills the session like a crashed browser does."""
+
+    def __init__(self, worker_id: int, failures: dict[str, list[Exception]]):
+        self.worker_id = worker_id
+        self.failures = failures
+        self.alive = True
+        self.quit_called = False
+        self.loaded: list[str] = []
+        self.shipment = None
+
+    def get(self, url: str):
+        if not self.alive:
+            raise InvalidSessionIdException('invalid session id')
+        self.shipment = url.split('/')[-1]
+        errors = self.failures.get(self.shipment)
+        if errors:
+            error = errors.pop(0)
+            if isinstance(error, InvalidSessionIdException):
+                self.alive = False
+            raise error
+        self.loaded.append(self.shipment)
+
+    def execute_script(self, script: str):
+        if not self.alive:
+            raise InvalidSessionIdException('invalid session id')
+        return 'complete'
+
+    def find_elements(self, by: str, value: str) -> list:
+        return [] if by == By.CLASS_NAME else [object()]
+
+    @property
+    def page_source(self) -> str:
+        return f'<html><body>{self.shipment}</body></html>'
+
+    def quit(self):
+        self.quit_called = True
+
+
+@pytest.fixture
+def drivers():
+    return []
+
+
+def run_download(tmp_path, drivers, shipments, failures=None, retries=3, resume=True):
+    failures = failures or {}
+
+    def driver_factory(worker_id: int) -> StubDriver:
+        drivers.append(StubDriver(worker_id, failures))
+        return drivers[-1]
+
+    return download_shipment_pages(
+        [f'/user/shipments/{shipment}' for shipment in shipments],
+        workers=1,
+        retries=retries,
+        base_url=BASE_URL,
+        directory=str(tmp_path),
+        driver_factory=driver_factory,
+        resume=resume,
+    )
+
+
+def test_saves_pages_without_leaving_part_files(tmp_path, drivers):
+    assert run_download(tmp_path, drivers, ['H1', 'H2']) == []
+    assert sorted(os.listdir(tmp_path)) == ['H1.html', 'H2.html']
+    assert (tmp_path / 'H2.html').read_text() == '<html><body>H2</body></html>'
+    assert len(drivers) == 1 and drivers[0].quit_called
+
+
+def test_retries_any_error_and_reports_exhausted_shipments(tmp_path, drivers):
+    failures = {
+        'H1': [TimeoutException('slow'), WebDriverException('net::ERR_CONNECTION_RESET')],
+        'H2': [OSError('disk full')] * 3,
+    }
+    assert run_download(tmp_path, drivers, ['H1', 'H2', 'H3'], failures) == ['H2']
+    assert sorted(os.listdir(tmp_path)) == ['H1.html', 'H3.html']
+    assert len(drivers) == 1
+
+
+def test_replaces_driver_after_lost_session(tmp_path, drivers):
+    failures = {'H2': [InvalidSessionIdException('session deleted because of page crash')]}
+    assert run_download(tmp_path, drivers, ['H1', 'H2', 'H3'], failures) == []
+    assert len(drivers) == 2
+    assert drivers[0].quit_called and drivers[0].loaded == ['H1']
+    assert drivers[1].loaded == ['H2', 'H3']
+
+
+def test_failed_save_is_retried(tmp_path, drivers, monkeypatch):
+    replace = os.replace
+    calls = []
+
+    def flaky_replace(source, destination):
+        calls.append(source)
+        if len(calls) == 1:
+            raise OSError('rename failed')
+        replace(source, destination)
+
+    monkeypatch.setattr(sbermarket_parser.os, 'replace', flaky_replace)
+    assert run_download(tmp_path, drivers, ['H1']) == []
+    assert len(calls) == 2
+    assert os.listdir(tmp_path) == ['H1.html']
+
+
+def test_resume_skips_saved_pages_but_not_partial_ones(tmp_path, drivers):
+    (tmp_path / 'H1.html').write_text('saved before')
+    (tmp_path / 'H2.html.part').write_text('interrupted')
+    assert get_pending_shipments(['/user/shipments/H1', '/user/shipments/H2'], str(tmp_path)) == ['H2']
+
+    assert run_download(tmp_path, drivers, ['H1', 'H2']) == []
+    assert drivers[0].loaded == ['H2']
+    assert (tmp_path / 'H1.html').read_text() == 'saved before'
+    assert not (tmp_path / 'H2.html.part').exists()
+
+    run_download(tmp_path, drivers, ['H1', 'H2'], resume=False)
+    assert drivers[1].loaded == ['H1', 'H2']
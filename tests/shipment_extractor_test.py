@@ -0,0 +1,132 @@
+from __future__ import annotations
+
+import json
+import pathlib
+import re
+import shutil
+
+import pytest
+
+from shipment_extractor import ENGINES
+from shipment_extractor import extract_page
+from shipment_extractor import extract_shipment
+from shipment_extractor import extract_shipments
+from shipment_extractor import ExtractionCache
+from shipment_extractor import ExtractionStats
+
+# order pages written by benchmarks.pages.generate_order_page and the records
+# the BeautifulSoup engine extracted from them
+FIXTURES = pathlib.Path(__file__).parent / 'fixtures'
+SHIPMENTS = sorted(path.stem for path in FIXTURES.glob('*.html'))
+# the hash suffix of CSS modules class names, e.g. __V0VHp of styles_name__V0VHp
+CLASS_HASH = re.compile(r'(\b[A-Za-z]+_[A-Za-z]+__)[\w-]{5}(?=[\s"])')
+
+
+def read_page(shipment_num: str) -> str:
+    return (FIXTURES / f'{shipment_num}.html').read_text()
+
+
+def read_record(shipment_num: str) -> dict:
+    return json.loads((FIXTURES / f'{shipment_num}.json').read_text())
+
+
+def as_json(record: dict) -> dict:
+    return json.loads(json.dumps(record))
+
+
+def rehash(src: str) -> str:
+    """the page after a site release which regenerated the CSS modules hashes"""
+    return CLASS_HASH.sub(r'\1zZ9_q', src)
+
+
+@pytest.mark.parametrize('engine', list(ENGINES))
+@pytest.mark.parametrize('shipment_num', SHIPMENTS)
+def test_engine_matches_golden_record(shipment_num, engine):
+    # extract_page is used directly, extract_shipment would hide an lxml
+    # failure behind its BeautifulSoup fallback
+    page = ENGINES[engine](read_page(shipment_num), ExtractionStats())
+    assert as_json(extract_page(shipment_num, page)) == read_record(shipment_num)
+
+
+@pytest.mark.parametrize('shipment_num', SHIPMENTS)
+def test_engines_produce_equal_records(shipment_num):
+    src = read_page(shipment_num)
+    records = [extract_page(shipment_num, page(src, ExtractionStats())) for page in ENGINES.values()]
+    assert all(record == records[0] for record in records)
+
+
+@pytest.mark.parametrize('engine', list(ENGINES))
+@pytest.mark.parametrize('shipment_num', SHIPMENTS)
+def test_fallback_selectors_survive_rehashed_class_names(shipment_num, engine):
+    src = rehash(read_page(shipment_num))
+    assert 'styles_name__V0VHp' not in src
+    stats = ExtractionStats()
+    record = extract_page(shipment_num, ENGINES[engine](src, stats))
+    assert as_json(record) == read_record(shipment_num)
+    assert stats.fields['product_name'].fallbacks == len(record['products'])
+    assert stats.status('product_name') == 'primary selector broken'
+    assert 'product_name' in stats.broken_fields()
+    assert 'shipment_merchant' not in stats.broken_fields()
+
+
+def test_required_field_missing_on_some_pages_is_partially_broken():
+    stats = ExtractionStats()
+    old_page, new_page = SHIPMENTS
+    extract_shipment(old_page, read_page(old_page), stats=stats)
+    # a release renamed the product name block, neither selector finds it
+    src = read_page(new_page).replace('styles_name__V0VHp', 'ProductCard_title__p4Kx2')
+    record = extract_shipment(new_page, src, stats=stats)
+    assert all(product['product_name'] is None for product in record['products'].values())
+    assert stats.pages == 2
+    assert stats.status('product_name').startswith('partially broken')
+    assert stats.broken_fields() == ['product_name']
+
+
+@pytest.mark.parametrize('shipment_num', SHIPMENTS)
+def test_extraction_without_stats(shipment_num):
+    stats = ExtractionStats()
+    src = read_page(shipment_num)
+    assert extract_shipment(shipment_num, src) == extract_shipment(shipment_num, src, stats=stats)
+    assert stats.pages == 1
+
+
+@pytest.fixture
+def pages_directory(tmp_path):
+    for shipment_num in SHIPMENTS:
+        shutil.copy(FIXTURES / f'{shipment_num}.html', tmp_path)
+    return tmp_path
+
+
+def extract_cached(directory, engine='lxml', version=None):
+    stats = ExtractionStats()
+    options = {'version': version} if version is not None else {}
+    with ExtractionCache(f'{directory}/extraction_cache.sqlite3', **options) as cache:
+        records = list(extract_shipments(SHIPMENTS, str(directory), engine=engine, stats=stats, cache=cache))
+    return records, stats, (cache.hits, cache.misses)
+
+
+def test_cache_reuses_records_and_stats_of_unchanged_pages(pages_directory):
+    records, cold_stats, counters = extract_cached(pages_directory)
+    assert counters == (0, 2)
+    assert records == list(extract_shipments(SHIPMENTS, str(pages_directory)))
+
+    warm_records, warm_stats, counters = extract_cached(pages_directory)
+    assert counters == (2, 0)
+    assert warm_records == records
+    assert (warm_stats.pages, warm_stats.cached_pages) == (2, 2)
+    assert warm_stats.to_dict()['fields'] == cold_stats.to_dict()['fields']
+    assert 'pages=2 (2 from the extraction cache)' in warm_stats.report()
+
+
+def test_cache_is_invalidated_by_page_engine_and_extractor_version(pages_directory):
+    extract_cached(pages_directory)
+    changed_page = pages_directory / f'{SHIPMENTS[0]}.html'
+    changed_page.write_text(changed_page.read_text().replace('Москва', 'Казань'))
+
+    records, _, counters = extract_cached(pages_directory)
+    assert counters == (1, 1)
+    assert records[0]['shipping_address'].startswith('Казань')
+
+    assert extract_cached(pages_directory, engine='bs4')[2] == (0, 2)
+    assert extract_cached(pages_directory, engine='lxml')[2] == (2, 0)
+    assert extract_cached(pages_directory, version='next')[2] == (0, 2)